@@ -23,4 +23,15 @@ from __future__ import division, print_function, absolute_import
 
 __version__ = "1"
 
-from matlab_wrapper.matlab_session import MatlabSession
+from matlab_wrapper.matlab_session import MatlabSession, TimeoutError
+from matlab_wrapper.session_pool import MatlabSessionPool
+from matlab_wrapper.prewarm import EnginePrewarmer
+from matlab_wrapper.supervisor import SupervisedSession
+from matlab_wrapper.server import MatlabServer, MatlabClient
+from matlab_wrapper.trace import Tracer
+
+import sys
+if sys.version_info >= (3, 7):
+    from matlab_wrapper.async_session import AsyncMatlabSession
+if sys.version_info >= (3, 8):
+    from matlab_wrapper.process_farm import MatlabProcessFarm
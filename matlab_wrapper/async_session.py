@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio interface to MATLAB (Python 3.7+ only)."""
+
+import asyncio
+import concurrent.futures
+
+from matlab_wrapper.matlab_session import MatlabSession, MatlabFunction
+
+
+def start_session(kwargs):
+    """Start MATLAB session and query its PID (needed to kill it
+    while it is busy).
+
+    """
+    session = MatlabSession(**kwargs)
+    session.pid
+    return session
+
+
+class AsyncMatlabSession(object):
+    """MATLAB session with awaitable methods.
+
+    All engine calls run in a dedicated worker thread, so that the
+    event loop is not blocked while MATLAB computes::
+
+      matlab = AsyncMatlabSession(options='-nojvm')
+
+      await matlab.put('a', 12.3)
+      await matlab.eval('b = a * 2')
+      b = await matlab.get('b')
+
+      s = await matlab.workspace.sin([0.1, 0.2, 0.3])
+      b = await matlab.workspace.b
+
+    MATLAB is started in the background, the first call waits for
+    it.  If a pending call is cancelled, then the MATLAB process is
+    killed (stopping the running computation) and a new session is
+    started for the following calls.  Other calls still pending in
+    the killed session fail with RuntimeError.
+
+    Parameters
+    ----------
+    **kwargs
+        Passed to `MatlabSession`.
+
+    """
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._closed = False
+        self._start()
+
+        self.workspace = AsyncWorkspace(self)
+
+
+    def _start(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._session_future = self._executor.submit(start_session, self._kwargs)
+
+
+    def _abandon(self):
+        """Kill the current MATLAB session and start a new one.  The
+        old session is closed (garbage collected) after its pending
+        calls return.
+
+        """
+        executor = self._executor
+        session_future = self._session_future
+
+        self._start()
+
+        executor.shutdown(wait=False)
+
+        ### A session that is still starting cannot be killed, it is
+        ### only abandoned
+        if session_future.done() and (session_future.exception() is None):
+            session = session_future.result()
+            try:
+                session.kill()
+            except RuntimeError:
+                pass
+
+
+    def _check_closed(self):
+        if self._closed:
+            raise RuntimeError("AsyncMatlabSession was closed.")
+
+
+    async def _run(self, func, *args, **kwargs):
+        """Run `func(session, *args, **kwargs)` in the worker thread."""
+        self._check_closed()
+
+        loop = asyncio.get_running_loop()
+        session_future = self._session_future
+
+        def call():
+            return func(session_future.result(), *args, **kwargs)
+
+        try:
+            out = await loop.run_in_executor(self._executor, call)
+        except asyncio.CancelledError:
+            if self._session_future is session_future:
+                self._abandon()
+            raise
+
+        return out
+
+
+    async def session(self):
+        """Wait for MATLAB to start and return the underlying
+        `MatlabSession`.
+
+        """
+        self._check_closed()
+        return await asyncio.wrap_future(self._session_future)
+
+
+    async def eval(self, expression, check=True):
+        """See `MatlabSession.eval()`."""
+        return await self._run(MatlabSession.eval, expression, check=check)
+
+
+    async def get(self, name, copy=True):
+        """See `MatlabSession.get()`."""
+        return await self._run(MatlabSession.get, name, copy=copy)
+
+
+    async def put(self, name, value):
+        """See `MatlabSession.put()`."""
+        return await self._run(MatlabSession.put, name, value)
+
+
+    async def get_many(self, names):
+        """See `MatlabSession.get_many()`."""
+        return await self._run(MatlabSession.get_many, names)
+
+
+    async def put_many(self, mapping):
+        """See `MatlabSession.put_many()`."""
+        return await self._run(MatlabSession.put_many, mapping)
+
+
+    async def close(self):
+        """Wait for pending calls, then close MATLAB session and stop
+        the worker thread.
+
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        executor = self._executor
+        self._session_future = None
+
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+
+    def __repr__(self):
+        r = '<AsyncMatlabSession>'
+
+        return r
+
+
+
+class AsyncWorkspace(object):
+    """Awaitable interface to MATLAB workspace.
+
+    Attributes are `AsyncMatlabFunction` objects, which can be either
+    called (MATLAB functions) or awaited (MATLAB variables)::
+
+      pi = await workspace.pi()
+      a = await workspace.a
+
+    Assignment is not supported (it cannot be awaited), use `await
+    AsyncMatlabSession.put()` instead.
+
+    """
+    def __init__(self, async_session):
+        object.__setattr__(self, '_async_session', async_session)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
+        return AsyncMatlabFunction(attr, self._async_session)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "Cannot assign MATLAB variable {0} through AsyncWorkspace, use `await session.put('{0}', value)`.".format(name)
+        )
+
+
+
+class AsyncMatlabFunction(object):
+    def __init__(self, name, async_session):
+        self.name = name
+        self._async_session = async_session
+
+
+    async def __call__(self, *args, **kwargs):
+
+        def call(session):
+            func = getattr(session.workspace, self.name)
+
+            if not isinstance(func, MatlabFunction):
+                raise TypeError("MATLAB variable is not callable: {}".format(self.name))
+
+            return func(*args, **kwargs)
+
+        return await self._async_session._run(call)
+
+
+    def __await__(self):
+
+        def get(session):
+            return getattr(session.workspace, self.name)
+
+        return self._async_session._run(get).__await__()
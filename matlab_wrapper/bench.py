@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of conversion and transfer throughput.
+
+Run with::
+
+  python -m matlab_wrapper.bench --output results.json
+
+The results (JSON) can be compared between commits with::
+
+  python -m matlab_wrapper.bench --compare old.json new.json
+
+Without MATLAB, the benchmarks can run against the stand-in libraries
+from tests/stub_matlab (function call and lookup benchmarks are
+skipped then, because the stand-in libraries cannot look up
+functions)::
+
+  make -C tests/stub_matlab
+  python -m matlab_wrapper.bench --matlab-root tests/stub_matlab/root
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import sys
+import json
+import argparse
+import platform
+
+import numpy as np
+
+import matlab_wrapper
+from matlab_wrapper.stats import timer, payload_size
+
+
+NUMERIC_DTYPES = ('double', 'single', 'int32', 'uint8')
+
+
+def put_get_cases(sizes):
+    """Put/get round trips of numeric, complex and logical arrays."""
+    for size in sizes:
+        for dtype in NUMERIC_DTYPES:
+            yield 'numeric', {'dtype': dtype, 'size': size}, np.random.randn(size).astype(dtype)
+
+        for dtype in ('complex64', 'complex128'):
+            a = np.random.randn(size) + np.random.randn(size)*1j
+            yield 'complex', {'dtype': dtype, 'size': size}, a.astype(dtype)
+
+        yield 'logical', {'size': size}, np.random.randn(size) > 0
+
+
+def nested_cell(depth, length):
+    if depth == 0:
+        return np.random.randn(4)
+
+    cell = np.empty(length, dtype='O')
+    for i in range(length):
+        cell[i] = nested_cell(depth-1, length)
+
+    return cell
+
+
+def cell_cases(quick):
+    lengths = (10, 1000) if quick else (10, 1000, 100000)
+    for length in lengths:
+        yield 'cell', {'depth': 1, 'length': length}, nested_cell(1, length)
+
+    for depth in ((2, 3) if quick else (2, 3, 4)):
+        yield 'cell', {'depth': depth, 'length': 10}, nested_cell(depth, 10)
+
+
+def struct_cases(quick):
+    field_nums = (10, 100) if quick else (10, 100, 1000)
+    for field_num in field_nums:
+        for records in (1, 100):
+            a = np.rec.fromarrays(
+                [np.random.randn(records) for _ in range(field_num)],
+                names=['f{}'.format(i) for i in range(field_num)]
+            )
+            yield 'struct', {'fields': field_num, 'records': records}, a
+
+
+def dataframe_cases(quick):
+    try:
+        import pandas as pd
+    except ImportError:
+        return
+
+    for rows in ((100, 10000) if quick else (100, 10000, 1000000)):
+        df = pd.DataFrame({
+            'a': np.random.randn(rows),
+            'b': np.arange(rows),
+            'c': np.random.randn(rows) > 0,
+        })
+        yield 'dataframe', {'rows': rows}, df
+
+
+
+def measure(func, repeat):
+    """Return sorted list of run times of `func`."""
+    times = []
+    for _ in range(repeat):
+        t0 = timer()
+        func()
+        times.append(timer() - t0)
+
+    return sorted(times)
+
+
+def result(name, params, times, nbytes=0, error=None):
+    r = {
+        'name': name,
+        'params': params,
+        'repeat': len(times),
+    }
+
+    if error is not None:
+        r['error'] = error
+        return r
+
+    r['best'] = times[0]
+    r['median'] = times[len(times)//2]
+
+    if nbytes and times[0] > 0:
+        r['bytes'] = nbytes
+        r['throughput_MBps'] = nbytes / times[0] / 1e6
+
+    return r
+
+
+def run_transfer(matlab, name, params, value, repeat):
+    """Benchmark put, get and put/get round trip of `value`."""
+    nbytes = payload_size(value)
+    results = []
+
+    for op in ('put', 'get', 'put_get'):
+        if op == 'put':
+            func = lambda: matlab.put('BENCH__', value)
+        elif op == 'get':
+            func = lambda: matlab.get('BENCH__')
+        else:
+            func = lambda: (matlab.put('BENCH__', value), matlab.get('BENCH__'))
+
+        try:
+            matlab.put('BENCH__', value)
+            times = measure(func, repeat)
+        except Exception as e:
+            results.append(result('{}_{}'.format(name, op), params, [], error=repr(e)))
+        else:
+            results.append(result('{}_{}'.format(name, op), params, times, nbytes))
+
+    return results
+
+
+def run_calls(matlab, repeat, pattern=None):
+    """Benchmark latency of Workspace lookups, MatlabFunction calls
+    and eval().  Lookups and calls are skipped if the workspace cannot
+    look up functions (e.g. stand-in libraries without `exist`).
+
+    """
+    try:
+        matlab.workspace.sin
+    except RuntimeError:
+        lookups = False
+    else:
+        lookups = True
+
+    cases = [
+        ('call', {'function': 'sin', 'args': 1}, lambda: matlab.workspace.sin(1.)),
+        ('call', {'function': 'sort', 'nout': 2}, lambda: matlab.workspace.sort(np.arange(10.), nout=2)),
+        ('call', {'function': 'pi', 'args': 0}, lambda: matlab.workspace.pi()),
+        ('lookup', {'cached': False}, lambda: (matlab.workspace.invalidate(), matlab.workspace.sin)),
+        ('lookup', {'cached': True}, lambda: matlab.workspace.sin),
+        ('eval', {}, lambda: matlab.eval('BENCH__ = 1;')),
+        ('eval_nocheck', {}, lambda: matlab.eval('BENCH__ = 1;', check=False)),
+    ]
+
+    results = []
+    for name, params, func in cases:
+        if pattern and (pattern not in name):
+            continue
+
+        if (name in ('call', 'lookup')) and not lookups:
+            continue
+
+        try:
+            func()
+            times = measure(func, repeat)
+        except Exception as e:
+            results.append(result(name, params, [], error=repr(e)))
+        else:
+            results.append(result(name, params, times))
+
+    return results
+
+
+def run(matlab, quick=False, repeat=5, pattern=None, out=sys.stdout):
+    """Run all benchmarks and return the results."""
+    if quick:
+        sizes = (1000, 100000)
+    else:
+        sizes = (1000, 100000, 10000000)
+
+    cases = []
+    cases.extend(put_get_cases(sizes))
+    cases.extend(cell_cases(quick))
+    cases.extend(struct_cases(quick))
+    cases.extend(dataframe_cases(quick))
+
+    results = []
+    for name, params, value in cases:
+        if pattern and (pattern not in name):
+            continue
+
+        for r in run_transfer(matlab, name, params, value, repeat):
+            print(format_result(r), file=out)
+            results.append(r)
+
+    for r in run_calls(matlab, repeat, pattern):
+        print(format_result(r), file=out)
+        results.append(r)
+
+    return results
+
+
+def format_result(r):
+    params = ' '.join('{}={}'.format(k, v) for k,v in sorted(r['params'].items()))
+
+    if 'error' in r:
+        stats = 'ERROR {}'.format(r['error'])
+    else:
+        stats = 'best {:10.1f} us  median {:10.1f} us'.format(r['best']*1e6, r['median']*1e6)
+        if 'throughput_MBps' in r:
+            stats += '  {:10.1f} MB/s'.format(r['throughput_MBps'])
+
+    return '{:<18} {:<36} {}'.format(r['name'], params, stats)
+
+
+def result_key(r):
+    return (r['name'], json.dumps(r['params'], sort_keys=True))
+
+
+def compare(old, new, out=sys.stdout):
+    """Print relative change of the best times between two result
+    files.
+
+    """
+    old_results = dict((result_key(r), r) for r in old['results'] if 'best' in r)
+
+    for r in new['results']:
+        o = old_results.get(result_key(r))
+        if (o is None) or ('best' not in r):
+            continue
+
+        change = r['best'] / o['best'] - 1
+        print('{:<60} {:+7.1%}'.format(format_result(r)[:55], change), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m matlab_wrapper.bench',
+        description="Benchmark matlab_wrapper conversions and transfers."
+    )
+    parser.add_argument('--matlab-root', default=None, help="MATLAB root directory")
+    parser.add_argument('--options', default='-nojvm', help="MATLAB options")
+    parser.add_argument('--repeat', type=int, default=5, help="repetitions of each benchmark")
+    parser.add_argument('--quick', action='store_true', help="skip the largest cases")
+    parser.add_argument('--filter', default=None, help="run only benchmarks containing this string")
+    parser.add_argument('--output', default=None, help="write JSON results to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        compare(old, new)
+        return
+
+    np.random.seed(0)
+
+    matlab = matlab_wrapper.MatlabSession(
+        options=args.options,
+        matlab_root=args.matlab_root,
+    )
+
+    results = run(
+        matlab,
+        quick=args.quick,
+        repeat=args.repeat,
+        pattern=args.filter,
+    )
+
+    doc = {
+        'matlab_wrapper': matlab_wrapper.__version__,
+        'matlab': matlab.version,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(doc, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
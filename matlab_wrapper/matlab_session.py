@@ -25,15 +25,68 @@ import numpy as np
 import platform
 from os.path import join, dirname, isfile, realpath
 import os
+import re
 import warnings
 import sys
 import weakref
-import collections
+import threading
+import json
+import tempfile
+import shutil
+import itertools
+import signal
+import numbers
 
 import ctypes
 from ctypes import c_char_p, POINTER, c_size_t, c_bool, c_void_p, c_int
 
 from matlab_wrapper.typeconv import dtype_to_mat
+from matlab_wrapper.stats import SessionStats, ByteCounter, timer
+from matlab_wrapper.trace import null_tracer
+
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+
+
+### Python 3: strings are passed to MATLAB as UTF-8 encoded bytes
+if sys.version_info[0] >= 3:
+    unicode = str
+
+
+def to_bytes(s):
+    """Encode `s` for MATLAB (C strings)."""
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return s
+
+
+def to_str(b):
+    """Decode `b` returned by MATLAB (C strings) to native `str`."""
+    if isinstance(b, bytes) and (str is not bytes):
+        b = b.decode('utf-8', 'replace')
+    return b
+
+
+class c_string(object):
+    """Argument type of C strings accepting `str`, `unicode`,
+    `bytes` and string buffers.
+
+    """
+    @classmethod
+    def from_param(cls, value):
+        if (value is None) or isinstance(value, ctypes.Array):
+            return value
+        return c_char_p(to_bytes(value))
+
+
+### TimeoutError is not available in Python 2
+try:
+    TimeoutError = TimeoutError
+except NameError:
+    class TimeoutError(OSError):
+        pass
 
 
 class mxArray(ctypes.Structure):
@@ -48,19 +101,93 @@ mwSize = c_size_t
 mwIndex = c_size_t
 
 
+### Temporary variables are suffixed with a number unique for each
+### call (e.g. ERRSTR12__), so that calls from several threads or
+### nested calls (e.g. from hooks) do not clobber each other
+catch_script = r"""
+    ERRSTR{n}__ = sprintf('%s: %s\n', ERR{n}__.identifier, ERR{n}__.message);
+    for i = 1:length(ERR{n}__.stack)
+        ERRSTR{n}__ = sprintf('%sError: in fuction %s in file %s line %i\n', ERRSTR{n}__, ERR{n}__.stack(i,1).name, ERR{n}__.stack(i,1).file, ERR{n}__.stack(i,1).line);
+    end
+"""
+
+
+### Printed to the output buffer on error, so that ERRSTR{n}__ is
+### only fetched when necessary
+error_sentinel = '<<matlab_wrapper:error>>'
+
+
 wrap_script = r"""
-ERRSTR__ = '';
 try
-    {0}
-catch err
-    ERRSTR__ = sprintf('%s: %s\n', err.identifier, err.message);
-    for i = 1:length(err.stack)
-        ERRSTR__ = sprintf('%sError: in fuction %s in file %s line %i\n', ERRSTR__, err.stack(i,1).name, err.stack(i,1).file, err.stack(i,1).line);
-    end
+    {expression}
+catch ERR{n}__
+""" + catch_script + r"""    disp('""" + error_sentinel + r"""')
 end
-if exist('ERRSTR__','var') == 0
-    ERRSTR__='';
+"""
+
+
+### Size of the output buffer used for error detection, if the user
+### did not request one
+default_buffer_size = 4096
+
+
+### Function call: arguments are passed in ARGS{n}__ (cell array),
+### the error string and all outputs are returned in RET{n}__ (cell
+### array).  RET of the previous call is cleared, if it is still
+### there (see `MatlabSession._stale_clear()`).
+call_script = r"""
+ERRSTR{n}__ = '';
+OUT{n}__ = cell(1, {nout});
+try
+    {call}
+catch ERR{n}__
+""" + catch_script + r"""end
+RET{n}__ = [{{ERRSTR{n}__}}, OUT{n}__];
+clear ARGS{n}__ OUT{n}__ ERRSTR{n}__ ERR{n}__ {stale}
+"""
+
+
+### Time given to the worker thread to return after MATLAB was killed
+kill_wait = 10.
+
+
+### Expressions changing the directory or MATLAB path invalidate all
+### resolved function names
+path_changing_re = re.compile(r'\b(cd|addpath|rmpath|path|restoredefaultpath)\b')
+
+### Identifiers in an expression (possibly variables shadowing
+### resolved functions)
+identifier_re = re.compile(r'[A-Za-z]\w*')
+
+
+### Shared memory transport: MATLAB classes, their numpy dtypes and
+### element sizes.  Logical arrays are stored as uint8.
+shm_classes = ['double', 'single', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64', 'logical']
+shm_dtypes = ['float64', 'float32', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64', 'bool']
+shm_sizes = [8, 4, 1, 1, 2, 2, 4, 4, 8, 8, 1]
+
+
+### MATLAB maps the file written by `put()`
+shm_put_script = r"""
+{tmp} = memmapfile('{path}', 'Format', {{'{cls}', [{dims}], 'x'}});
+{name} = {convert}({tmp}.Data.x);
+clear {tmp}
+"""
+
+
+### MATLAB writes large numeric arrays into a file for `get()`.  The
+### file starts with a header (doubles): class index (in
+### `shm_classes`, 1-based), number of dimensions and dimensions.
+shm_get_script = r"""
+{tmp} = find(strcmp(class({name}), {{{classes}}}), 1);
+{sz} = [{sizes}];
+if ~isempty({tmp}) && isreal({name}) && ~issparse({name}) && (numel({name}) * {sz}({tmp}) >= {threshold})
+    {fid} = fopen('{path}', 'w');
+    fwrite({fid}, [{tmp}, ndims({name}), size({name})], 'double');
+    fwrite({fid}, {name}, strrep(class({name}), 'logical', 'uint8'));
+    fclose({fid});
 end
+clear {tmp} {sz} {fid}
 """
 
 
@@ -80,6 +207,27 @@ class MatlabSession(object):
     buffer_size : int, optional
         MATLAB output buffer size.  The output buffer can be accessed
         through `output_buffer` property.
+    check_mtime : bool, optional
+        Functions accessed through `workspace` are resolved once and
+        cached.  If True, functions defined in M-files are resolved
+        again after the file is modified.
+    tracer : Tracer or None, optional
+        Record timeline of engine calls and conversions (see
+        `matlab_wrapper.Tracer`).
+    shm_threshold : int or None, optional
+        Real numeric and logical arrays of at least `shm_threshold`
+        bytes are transferred by `put()` and `get()` through a file in
+        shared memory (`shm_dir`) instead of the engine pipe.  Note
+        that `get()` needs an extra (small) engine call when enabled.
+    shm_dir : str or None, optional
+        Directory for the shared memory transport, by default
+        /dev/shm (if available) or the temporary directory.  The
+        files are created in a private subdirectory (mode 0700)
+        removed with the session.
+
+    A session can be shared by several threads: engine calls are
+    serialized, conversions between MATLAB and numpy run
+    concurrently.
 
     Attributes
     ----------
@@ -89,15 +237,32 @@ class MatlabSession(object):
         Easy access to MATLAB workspace, e.g. `workspace.sin([1.,2.,3.])`.
     version : tuple or None
         MATLAB/libeng version number.
+    tracer : Tracer
+        Timeline recorder (can be replaced at any time).
 
     Methods
     -------
     get()
     put()
+    get_many()
+    put_many()
     eval()
+    restart()
+    close()
+    stats()
+    add_stats_hook()
 
     """
-    def __init__(self, options='-nosplash', matlab_root=None, buffer_size=0):
+    def __init__(
+            self,
+            options='-nosplash',
+            matlab_root=None,
+            buffer_size=0,
+            check_mtime=False,
+            tracer=None,
+            shm_threshold=None,
+            shm_dir=None
+    ):
 
         if (matlab_root is None) and ('MATLABROOT' in os.environ):
             matlab_root = os.environ['MATLABROOT']
@@ -109,6 +274,7 @@ class MatlabSession(object):
             raise RuntimeError("Unknown MATLAB location: try to initialize MatlabSession with matlab_root set properly.")
 
         self._matlab_root = matlab_root
+        self._options = options
 
         engine, libeng, libmx, version = load_engine_and_libs(matlab_root, options)
 
@@ -123,113 +289,957 @@ class MatlabSession(object):
 
 
 
-        ### Setup the output buffer
-        if buffer_size != 0:
-            self._output_buffer = ctypes.create_string_buffer(buffer_size)
-            self._libeng.engOutputBuffer(
-                self._ep,
-                self._output_buffer,
-                buffer_size-1
-            )
+        ### Shared memory transport for large arrays
+        if (shm_dir is None) and os.path.isdir('/dev/shm'):
+            shm_dir = '/dev/shm'
+        elif shm_dir is None:
+            shm_dir = tempfile.gettempdir()
+
+        self._shm_threshold = shm_threshold
+        self._shm_dir = shm_dir
+        self._shm_private = None
+
+
+
+        ### Setup the output buffer (always present, because it is
+        ### used for error detection in `eval()`)
+        self._buffer_requested = (buffer_size != 0)
+
+        if buffer_size == 0:
+            buffer_size = default_buffer_size
+
+        self._buffer_size = buffer_size
+        self._output_buffer = ctypes.create_string_buffer(buffer_size)
+        self._libeng.engOutputBuffer(
+            self._ep,
+            self._output_buffer,
+            buffer_size-1
+        )
+
+
+        ### Statistics and timeline of engine calls and conversions
+        self._stats = SessionStats()
+
+        if tracer is None:
+            self.tracer = null_tracer
         else:
-            self._output_buffer = None
+            self.tracer = tracer
 
 
         ### Workspace object
-        self.workspace = Workspace(weakref.ref(self))
+        self.workspace = Workspace(weakref.ref(self), check_mtime=check_mtime)
+
+        self._pid = None
+        self._killed = False
+
+
+        ### Engine access is serialized, conversions run concurrently
+        self._lock = threading.RLock()
+        self._counter = itertools.count()
+
+        ### RET{n}__ of the last function call (cleared by the next one)
+        self._stale_ret = ''
 
 
 
 
     def __del__(self):
         try:
-            self._libeng.engClose(self._ep)
-        except AttributeError:
+            if self._ep is not None:
+                self._libeng.engClose(self._ep)
+        except (AttributeError, RuntimeError):
             pass
 
+        if getattr(self, '_shm_private', None) is not None:
+            shutil.rmtree(self._shm_private, ignore_errors=True)
+
 
 
     @property
     def output_buffer(self):
-        if self._output_buffer is None:
+        if not self._buffer_requested:
             raise RuntimeError("Output buffer was not initialized properly.")
         else:
-            return self._output_buffer.value
+            return to_str(self._output_buffer.value).replace(error_sentinel + '\n', '')
+
+
+
+    @property
+    def pid(self):
+        """Process ID of the MATLAB engine or None if not available."""
+        if self._pid is None:
+            name = self._temp_name('PID')
+            try:
+                with self._lock:
+                    self._eval_internal("{} = feature('getpid');".format(name))
+                    self._pid = int(self.get(name))
+                    self._eval_internal("clear {}".format(name), check=False)
+            except (RuntimeError, TypeError, ValueError):
+                return None
+
+        return self._pid
+
+
+
+    def close(self):
+        """Close MATLAB engine.  The session refuses further calls
+        until `restart()`.
+
+        """
+        with self._lock:
+            if self._ep is None:
+                return
+
+            try:
+                self._libeng.engClose(self._ep)
+            except RuntimeError:
+                pass
+
+            self._ep = None
+
+
+
+    def restart(self):
+        """Close MATLAB engine and start a new one, e.g. after a
+        timeout.  All variables in MATLAB workspace are lost.
+
+        """
+        with self._lock:
+            self.close()
+
+            engine, libeng, libmx, version = load_engine_and_libs(self._matlab_root, self._options)
+
+            self._ep = engine
+            self._libeng.engOutputBuffer(
+                self._ep,
+                self._output_buffer,
+                self._buffer_size-1
+            )
+
+            self._pid = None
+            self._killed = False
+            self._stale_ret = ''
+            self.workspace.invalidate()
+
+        self._stats.record('restart')
+
+
+
+    def _temp_number(self):
+        """Return a number unique for this session (used to name
+        temporary variables).
+
+        """
+        return next(self._counter)
+
+
+
+    def _temp_name(self, prefix):
+        return "{}{}__".format(prefix, self._temp_number())
+
+
+
+    def _stale_clear(self):
+        """Return MATLAB command clearing RET{n}__ left by the last
+        function call (empty string if there is none).  Must be
+        called with the lock held and the command must be evaluated.
+
+        """
+        stale = self._stale_ret
+        self._stale_ret = ''
+
+        if stale:
+            return 'clear {}; '.format(stale)
+        else:
+            return ''
+
+
+
+    def _clear_stale_ret(self):
+        """Clear RET{n}__ of the last function call before an engine
+        operation that does not evaluate anything.
+
+        """
+        clear = self._stale_clear()
+        if clear:
+            self._eval_quiet(clear)
+
+
+
+    def _check_engine(self):
+        if self._killed:
+            raise RuntimeError("MATLAB engine was killed, call restart().")
+
+        if self._ep is None:
+            raise RuntimeError("MATLAB engine was closed, call restart().")
+
+
 
+    def kill(self):
+        """Kill MATLAB process, e.g. from another thread while a
+        computation is running.  The session refuses further calls
+        until `restart()`.
 
+        The PID must be already known (see `pid`), because it cannot
+        be queried from a busy engine.
 
-    def eval(self, expression):
+        """
+        if self._pid is None:
+            raise RuntimeError("Unknown PID of MATLAB engine: cannot kill it.")
+
+        kill_process(self._pid)
+        self._killed = True
+
+
+
+    def _run_with_timeout(self, func, timeout):
+        """Run `func()` in a worker thread.  Kill MATLAB engine and
+        raise TimeoutError, if it does not return within `timeout`
+        seconds.
+
+        """
+        ### PID must be known before MATLAB gets busy
+        pid = self.pid
+        if pid is None:
+            raise RuntimeError("Unknown PID of MATLAB engine: timeout is not supported.")
+
+        result = {}
+
+        def target():
+            try:
+                result['value'] = func()
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+
+        if thread.is_alive():
+            self.kill()
+
+            ### Engine calls return as soon as MATLAB is gone
+            thread.join(kill_wait)
+
+            self._stats.record('timeout', error=True)
+
+            raise TimeoutError(
+                "MATLAB did not finish within {} s: engine was killed, call restart().".format(timeout)
+            )
+
+        if 'error' in result:
+            raise result['error']
+
+        return result.get('value')
+
+
+
+    def eval(self, expression, check=True, timeout=None):
         """Evaluate `expression` in MATLAB engine.
 
         Parameters
         ----------
         expression : str
             Expression is passed to MATLAB engine and evaluated.
+        check : bool, optional
+            If False, then the expression is evaluated as is and MATLAB
+            errors are silently ignored (fire-and-forget).
+        timeout : float or None, optional
+            If the evaluation takes longer than `timeout` seconds, then
+            MATLAB engine is killed and TimeoutError is raised.  The
+            session can be started again with `restart()`.
 
         """
-        expression_wrapped = wrap_script.format(expression)
+        if timeout is not None:
+            return self._run_with_timeout(
+                lambda: self.eval(expression, check=check),
+                timeout
+            )
 
+        ### Resolved function names might not be valid anymore
+        if path_changing_re.search(expression):
+            self.workspace.invalidate()
+        else:
+            self.workspace.invalidate(
+                set(identifier_re.findall(expression))
+            )
 
-        ### Evaluate the expression
-        self._libeng.engEvalString(self._ep, expression_wrapped)
+        self._eval_internal(expression, check=check)
 
-        ### Check for exceptions in MATLAB
-        mxresult = self._libeng.engGetVariable(self._ep, 'ERRSTR__')
 
-        error_string = self._libmx.mxArrayToString(mxresult)
 
-        self._libmx.mxDestroyArray(mxresult)
+    def _eval_internal(self, expression, check=True):
+        """Evaluate `expression` without invalidating resolved
+        functions (for scripts generated by the wrapper, which only
+        touch temporary variables).
+
+        """
+        if not check:
+            with self._lock:
+                self._check_engine()
+
+                t0 = timer()
+                with self.tracer.span('engEvalString', 'engine', expression=expression):
+                    self._libeng.engEvalString(self._ep, self._stale_clear() + expression)
+
+            self._stats.record('eval', transport=timer()-t0)
+            return
+
+
+        n = self._temp_number()
+        expression_wrapped = wrap_script.format(expression=expression, n=n)
+
+
+        with self._lock:
+            self._check_engine()
+
+            t0 = timer()
+
+            ### Evaluate the expression
+            with self.tracer.span('engEvalString', 'engine', expression=expression):
+                self._libeng.engEvalString(self._ep, self._stale_clear() + expression_wrapped)
+
+
+            ### Check for exceptions in MATLAB: ERRSTR{n}__ is fetched
+            ### only if the error sentinel was printed or the output
+            ### was truncated (sentinel might be lost)
+            output = to_str(self._output_buffer.value)
+            truncated = len(output) >= self._buffer_size - 1
+
+            if (error_sentinel in output) or truncated:
+                error_string = self._get_error_string(n)
+            else:
+                error_string = ""
+
+        self._stats.record(
+            'eval',
+            transport=timer()-t0,
+            error=(error_string != "")
+        )
 
         if error_string != "":
             raise RuntimeError("Error from MATLAB\n{0}".format(error_string))
 
 
 
-    def get(self, name):
+    def _get_error_string(self, n):
+        """Fetch and clear ERRSTR{n}__ from MATLAB workspace.  Return
+        empty string if there was no error.
+
+        """
+        errstr = 'ERRSTR{}__'.format(n)
+
+        try:
+            with self.tracer.span('engGetVariable', 'engine', name=errstr):
+                mxresult = self._libeng.engGetVariable(self._ep, errstr)
+        except RuntimeError:
+            ### ERRSTR{n}__ does not exist: no error
+            return ""
+
+        ### The string allocated by MATLAB must be freed with mxFree()
+        error_p = self._libmx.mxArrayToString(mxresult)
+
+        if error_p is None:
+            error_string = "Unknown error ({} is not a string)".format(errstr)
+        else:
+            error_string = to_str(ctypes.string_at(error_p))
+            self._libmx.mxFree(error_p)
+
+        self._libmx.mxDestroyArray(mxresult)
+
+        self._eval_quiet('clear {} ERR{}__'.format(errstr, n))
+
+        return error_string
+
+
+
+    def _eval_quiet(self, expression):
+        """Evaluate `expression` keeping the output buffer of the
+        previous evaluation (engEvalString() resets it).
+
+        """
+        output = self._output_buffer.value
+
+        with self.tracer.span('engEvalString', 'engine', expression=expression):
+            self._libeng.engEvalString(self._ep, expression)
+
+        self._output_buffer.value = output
+
+
+
+    def get(self, name, copy=True):
         """Get variable `name` from MATLAB workspace.
 
         Parameters
         ----------
         name : str
             Name of the variable in MATLAB workspace.
+        copy : bool, optional
+            If `False`, then numeric (real) and logical arrays are not
+            copied, but share memory with the underlying mxArray.  The
+            mxArray is destroyed when the last array referencing it is
+            garbage collected.
+
+        Returns
+        -------
+        array_like
+            Value of the variable `name`.
+
+        """
+        if self._shm_threshold is not None:
+            found, out = self._get_shm(name)
+            if found:
+                return out
+
+        with self._lock:
+            self._check_engine()
+
+            t0 = timer()
+
+            self._clear_stale_ret()
+
+            with self.tracer.span('engGetVariable', 'engine', name=name):
+                pm = self._libeng.engGetVariable(self._ep, name)
+
+        t1 = timer()
+
+        counter = ByteCounter()
+
+        with self.tracer.span('mxarray_to_ndarray', 'conversion', name=name) as span:
+            if copy:
+                out = mxarray_to_ndarray(self._libmx, pm, tracer=self.tracer, counter=counter)
+                self._libmx.mxDestroyArray(pm)
+
+            else:
+                owner = MxArrayOwner(self._libmx, pm)
+                out = mxarray_to_ndarray(self._libmx, pm, owner=owner, tracer=self.tracer, counter=counter)
+
+            nbytes = counter.nbytes
+            span.set(nbytes=nbytes)
+
+        self._stats.record(
+            'get',
+            name=name,
+            transport=t1-t0,
+            conversion=timer()-t1,
+            nbytes=nbytes
+        )
+
+        return out
+
+
+
+
+    def put(self, name, value):
+        """Put a variable to MATLAB workspace.
+
+        """
+        ### Variable can shadow a function
+        self.workspace.invalidate([name])
+
+        if self._use_shm(value):
+            self._put_shm(name, value)
+            return
+
+        t0 = timer()
+
+        with self.tracer.span('ndarray_to_mxarray', 'conversion', name=name) as span:
+            counter = ByteCounter()
+            pm = ndarray_to_mxarray(self._libmx, value, tracer=self.tracer, counter=counter)
+
+            nbytes = counter.nbytes
+            span.set(nbytes=nbytes)
+
+        t1 = timer()
+
+        try:
+            with self._lock:
+                self._check_engine()
+
+                self._clear_stale_ret()
+
+                with self.tracer.span('engPutVariable', 'engine', name=name, nbytes=nbytes):
+                    self._libeng.engPutVariable(self._ep, name, pm)
+        finally:
+            self._libmx.mxDestroyArray(pm)
+
+        self._stats.record(
+            'put',
+            name=name,
+            transport=timer()-t1,
+            conversion=t1-t0,
+            nbytes=nbytes
+        )
+
+
+
+    def _shm_path(self, ext='.bin'):
+        ### Other users must not read the data or plant symlinks in
+        ### world-writable /dev/shm: use a private directory
+        with self._lock:
+            if self._shm_private is None:
+                self._shm_private = tempfile.mkdtemp(
+                    prefix='matlab_wrapper_',
+                    dir=self._shm_dir
+                )
+
+        return join(
+            self._shm_private,
+            "{}{}".format(self._temp_number(), ext)
+        )
+
+
+
+    def _use_shm(self, value):
+        return (
+            (self._shm_threshold is not None)
+            and isinstance(value, np.ndarray)
+            and (value.dtype.name in shm_dtypes)
+            and (value.nbytes > 0)
+            and (value.nbytes >= self._shm_threshold)
+        )
+
+
+
+    def _put_shm(self, name, value):
+        """Write `value` into a file in shared memory and map it in
+        MATLAB with `memmapfile`.
+
+        """
+        path = self._shm_path()
+        cls = shm_classes[shm_dtypes.index(value.dtype.name)]
+
+        ### MATLAB arrays have at least two dimensions, 1-D arrays
+        ### become rows as in `ndarray_to_mxarray()`
+        dims = [1] * (2 - value.ndim) + list(value.shape)
+
+        t0 = timer()
+
+        try:
+            with self.tracer.span('shm_write', 'conversion', name=name, nbytes=value.nbytes):
+                ### Native byte order, Fortran order (the transpose of
+                ### a Fortran array is written in memory order)
+                arr = np.asfortranarray(value, dtype=value.dtype.newbyteorder('='))
+                arr.T.tofile(path)
+
+            t1 = timer()
+
+            self._eval_internal(
+                shm_put_script.format(
+                    tmp=self._temp_name('MMAP'),
+                    path=path,
+                    cls='uint8' if cls == 'logical' else cls,
+                    dims=' '.join(str(d) for d in dims),
+                    name=name,
+                    convert='logical' if cls == 'logical' else '',
+                )
+            )
+
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        self._stats.record(
+            'put',
+            name=name,
+            transport=timer()-t1,
+            conversion=t1-t0,
+            nbytes=value.nbytes
+        )
+
+
+
+    def _get_shm(self, name):
+        """Let MATLAB write `name` into a file in shared memory, if it
+        is a large numeric array.
+
+        Returns
+        -------
+        found : bool
+            False if `name` is not suitable for the transport.
+        out : ndarray or None
+
+        """
+        path = self._shm_path()
+
+        t0 = timer()
+
+        try:
+            self._eval_internal(
+                shm_get_script.format(
+                    tmp=self._temp_name('CLS'),
+                    sz=self._temp_name('SZ'),
+                    fid=self._temp_name('FID'),
+                    name=name,
+                    classes=', '.join("'{}'".format(c) for c in shm_classes),
+                    sizes=' '.join(str(n) for n in shm_sizes),
+                    threshold=self._shm_threshold,
+                    path=path,
+                )
+            )
+
+            if not os.path.exists(path):
+                return False, None
+
+            t1 = timer()
+
+            with self.tracer.span('shm_read', 'conversion', name=name):
+                with open(path, 'rb') as f:
+                    cls, ndims = np.fromfile(f, dtype='float64', count=2).astype(int)
+                    dims = tuple(int(d) for d in np.fromfile(f, dtype='float64', count=ndims))
+                    pyarray = np.fromfile(f, dtype=shm_dtypes[cls-1], count=int(np.prod(dims)))
+
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        ### Same shape as from `mxarray_to_ndarray()`
+        out = pyarray.reshape(dims, order='F').squeeze()
+        if out.ndim == 0:
+            out, = np.atleast_1d(out)
+
+        self._stats.record(
+            'get',
+            name=name,
+            transport=t1-t0,
+            conversion=timer()-t1,
+            nbytes=pyarray.nbytes
+        )
+
+        return True, out
+
+
+
+    def get_many(self, names):
+        """Get several variables from MATLAB workspace at once.
+
+        The variables are packed into a single struct in MATLAB and
+        transferred together, which is much faster than calling
+        `get()` for each of them.
+
+        Parameters
+        ----------
+        names : list of str
+            Names of the variables in MATLAB workspace.
+
+        Returns
+        -------
+        dict
+            Values of the variables indexed by their names.
+
+        """
+        names = list(names)
+
+        if not names:
+            return {}
+
+        tmp = self._temp_name('GETMANY')
+        clear = 'clear {}'.format(tmp)
+
+        with self._lock:
+            try:
+                self._eval_internal(
+                    '; '.join(
+                        ["{} = struct()".format(tmp)] + ["{0}.{1} = {1}".format(tmp, name) for name in names]
+                    ) + ';'
+                )
+            except RuntimeError:
+                ### e.g. missing variable after GETMANY{n}__ was created
+                self._eval_internal(clear, check=False)
+                raise
+
+            t0 = timer()
+
+            with self.tracer.span('engGetVariable', 'engine', name=tmp):
+                pm = self._libeng.engGetVariable(self._ep, tmp)
+
+            with self.tracer.span('engEvalString', 'engine', expression=clear):
+                self._libeng.engEvalString(self._ep, clear)
+
+        t1 = timer()
+
+        counter = ByteCounter()
+
+        out = {}
+        for name in names:
+            with self.tracer.span('mxarray_to_ndarray', 'conversion', name=name):
+                field = self._libmx.mxGetField(pm, 0, name)
+                out[name] = mxarray_to_ndarray(self._libmx, field, tracer=self.tracer, counter=counter)
+
+        self._libmx.mxDestroyArray(pm)
+
+        self._stats.record(
+            'get_many',
+            transport=t1-t0,
+            conversion=timer()-t1,
+            nbytes=counter.nbytes
+        )
+
+        return out
+
+
+
+    def put_many(self, mapping):
+        """Put several variables to MATLAB workspace at once.
+
+        The variables are transferred together in a single struct and
+        unpacked in MATLAB, which is much faster than calling `put()`
+        for each of them.
+
+        Parameters
+        ----------
+        mapping : dict
+            Values of the variables indexed by their names.
+
+        """
+        names = list(mapping.keys())
+
+        if not names:
+            return
+
+        ### Variables can shadow functions
+        self.workspace.invalidate(names)
+
+        t0 = timer()
+
+        dim = (mwSize*2)(1, 1)
+        names_p = (c_char_p*len(names))(*[c_char_p(to_bytes(name)) for name in names])
+
+        pm = self._libmx.mxCreateStructArray(2, dim, len(names), names_p)
+
+        counter = ByteCounter()
+        try:
+            for name in names:
+                with self.tracer.span('ndarray_to_mxarray', 'conversion', name=name):
+                    p = ndarray_to_mxarray(self._libmx, mapping[name], tracer=self.tracer, counter=counter)
+                    self._libmx.mxSetField(pm, 0, name, p)
+        except Exception:
+            ### Destroys the values converted so far
+            self._libmx.mxDestroyArray(pm)
+            raise
+
+        t1 = timer()
+
+        tmp = self._temp_name('PUTMANY')
+
+        with self._lock:
+            try:
+                self._check_engine()
+
+                with self.tracer.span('engPutVariable', 'engine', name=tmp):
+                    self._libeng.engPutVariable(self._ep, tmp, pm)
+            finally:
+                self._libmx.mxDestroyArray(pm)
+
+            self._stats.record(
+                'put_many',
+                transport=timer()-t1,
+                conversion=t1-t0,
+                nbytes=counter.nbytes
+            )
+
+            self._eval_internal(
+                '; '.join(
+                    ["{1} = {0}.{1}".format(tmp, name) for name in names] + ["clear {}".format(tmp)]
+                ) + ';'
+            )
+
+
+
+
+
+    def put_bulk(self, mapping):
+        """Put many variables to MATLAB workspace through a MAT-file.
+
+        The variables are written with `scipy.io.savemat()` into a
+        MAT-file in shared memory (see `shm_dir`) and loaded with a
+        single `load` in MATLAB.  Much faster than `put()` or
+        `put_many()` for many variables or large cells/structs.
+        Requires scipy.
+
+        Parameters
+        ----------
+        mapping : dict
+            Values of the variables indexed by their names.
+
+        """
+        import scipy.io
+
+        names = list(mapping.keys())
+
+        if not names:
+            return
+
+        self.workspace.invalidate(names)
+
+        path = self._shm_path('.mat')
+
+        t0 = timer()
+
+        try:
+            with self.tracer.span('savemat', 'conversion', path=path):
+                scipy.io.savemat(
+                    path,
+                    mapping,
+                    format='5',
+                    oned_as='row',
+                    do_compression=False
+                )
+
+            t1 = timer()
+
+            nbytes = os.path.getsize(path)
+
+            self._eval_internal("load('{}');".format(path))
+
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        self._stats.record(
+            'put_bulk',
+            transport=timer()-t1,
+            conversion=t1-t0,
+            nbytes=nbytes
+        )
+
+
+
+    def get_bulk(self, names):
+        """Get many variables from MATLAB workspace through a MAT-file.
+
+        MATLAB saves the variables into a MAT-file in shared memory
+        (see `shm_dir`), which is read with `scipy.io.loadmat()`.  The
+        values are converted the same way as in `get()`.  Requires
+        scipy.
+
+        Parameters
+        ----------
+        names : list of str
+            Names of the variables in MATLAB workspace.
+
+        Returns
+        -------
+        dict
+            Values of the variables indexed by their names.
+
+        """
+        import scipy.io
+
+        names = list(names)
+
+        if not names:
+            return {}
+
+        path = self._shm_path('.mat')
+
+        t0 = timer()
+
+        try:
+            ### Version 6 files are not compressed
+            self._eval_internal(
+                "save('{path}', {names}, '-v6');".format(
+                    path=path,
+                    names=', '.join("'{}'".format(name) for name in names)
+                )
+            )
+
+            t1 = timer()
+
+            nbytes = os.path.getsize(path)
+
+            with self.tracer.span('loadmat', 'conversion', path=path):
+                data = scipy.io.loadmat(
+                    path,
+                    squeeze_me=False,
+                    chars_as_strings=False,
+                    mat_dtype=True
+                )
+
+                out = {name: loadmat_to_ndarray(data[name]) for name in names}
+
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        self._stats.record(
+            'get_bulk',
+            transport=t1-t0,
+            conversion=timer()-t1,
+            nbytes=nbytes
+        )
+
+        return out
+
+
+
+    def stats(self, reset=False):
+        """Return statistics of engine calls and conversions.
+
+        Parameters
+        ----------
+        reset : bool, optional
+            Reset the statistics after taking the snapshot.
 
         Returns
         -------
-        array_like
-            Value of the variable `name`.
+        dict
+            For each operation (`eval`, `get`, `put`, `get_many`,
+            `put_many`, `get_bulk`, `put_bulk`, `call`, `lookup`,
+            `lookup_cached`): `count`,
+            `errors`, `transport_time` and `conversion_time` (in
+            seconds), `bytes` and latency histogram (`histogram_us`,
+            power of two buckets in microseconds).
 
         """
-        pm = self._libeng.engGetVariable(self._ep, name)
+        return self._stats.snapshot(reset=reset)
 
-        out = mxarray_to_ndarray(self._libmx, pm)
 
 
-        self._libmx.mxDestroyArray(pm)
+    def add_stats_hook(self, hook):
+        """Register `hook(event)` called after each recorded operation.
 
-        return out
+        `event` is a namedtuple with fields: `op`, `name`,
+        `transport`, `conversion`, `nbytes` and `error`.
 
+        """
+        self._stats.hooks.append(hook)
 
 
 
-    def put(self, name, value):
-        """Put a variable to MATLAB workspace.
+    def remove_stats_hook(self, hook):
+        """Unregister `hook` added with `add_stats_hook()`."""
+        self._stats.hooks.remove(hook)
 
-        """
 
-        pm = ndarray_to_mxarray(self._libmx, value)
 
-        self._libeng.engPutVariable(self._ep, name, pm)
+    def __repr__(self):
+        r = '<MatlabSession:{root}>'.format(root=self._matlab_root)
 
-        self._libmx.mxDestroyArray(pm)
+        return r
 
 
+def kill_process(pid):
+    """Kill process `pid`, ignore if it is already gone."""
+    try:
+        os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+    except OSError:
+        pass
 
 
 
-    def __repr__(self):
-        r = '<MatlabSession:{root}>'.format(root=self._matlab_root)
+def string_check(result, func, arguments):
+    """Check and decode C string returned by MATLAB."""
+    if result is None:
+        raise RuntimeError(
+            "MATLAB function {func} failed with arguments:\n{arguments}".format(
+                func=str(func),
+                arguments=str(arguments)
+            )
+        )
+    return to_str(result)
 
-        return r
 
 
 def error_check(result, func, arguments):
@@ -243,23 +1253,93 @@ def error_check(result, func, arguments):
     return result
 
 
+### Process-wide caches: MATLAB root directories (keyed by PATH) and
+### loaded libraries (keyed by MATLAB root)
+matlab_root_cache = {}
+libs_cache = {}
+libs_cache_lock = threading.Lock()
+
+
 def find_matlab_root():
     """Look for matlab binary and return root directory of MATLAB
     installation.
 
+    The result is cached for the process.  If MATLAB_WRAPPER_CACHE
+    environment variable is set, then it is also cached on disk in a
+    file of that name.
+
+    """
+    path = os.environ.get("PATH")
+
+    if path in matlab_root_cache:
+        return matlab_root_cache[path]
+
+    cache_file = os.environ.get("MATLAB_WRAPPER_CACHE")
+
+    matlab_root = read_matlab_root_cache(cache_file, path)
+
+    if matlab_root is None:
+        path_dirs = path.split(os.pathsep)
+        for path_dir in path_dirs:
+            candidate = realpath(join(path_dir, 'matlab'))
+            if isfile(candidate) or isfile(candidate + '.exe'):
+                matlab_root = dirname(dirname(candidate))
+                break
+
+        if matlab_root is not None:
+            write_matlab_root_cache(cache_file, path, matlab_root)
+
+    matlab_root_cache[path] = matlab_root
+
+    return matlab_root
+
+
+def read_matlab_root_cache(cache_file, path):
+    """Return MATLAB root stored in `cache_file` for `path` (or None
+    if not available or not valid anymore).
+
     """
-    matlab_root = None
+    if cache_file is None:
+        return None
+
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    matlab_root = cache.get(path)
 
-    path_dirs = os.environ.get("PATH").split(os.pathsep)
-    for path_dir in path_dirs:
-        candidate = realpath(join(path_dir, 'matlab'))
-        if isfile(candidate) or isfile(candidate + '.exe'):
-            matlab_root = dirname(dirname(candidate))
-            break
+    if matlab_root is None:
+        return None
+
+    executable = join(matlab_root, 'bin', 'matlab')
+    if not (isfile(executable) or isfile(executable + '.exe')):
+        return None
 
     return matlab_root
 
 
+def write_matlab_root_cache(cache_file, path, matlab_root):
+    """Store MATLAB root for `path` in `cache_file` (best effort)."""
+    if cache_file is None:
+        return
+
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        cache = {}
+
+    cache[path] = matlab_root
+
+    try:
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f)
+    except (IOError, OSError):
+        warnings.warn("Unable to write MATLAB root cache file: {}".format(cache_file))
+
+
 def load_engine_and_libs(matlab_root, options):
     """Load and return `libeng` and `libmx`.  Start and return MATLAB
     engine.
@@ -269,8 +1349,48 @@ def load_engine_and_libs(matlab_root, options):
     engine
     libeng
     libmx
+    version
+
+    """
+    libeng, libmx, version, executable = load_libs(matlab_root)
+
+    if executable is None:
+        command = None
+    else:
+        command = "{executable} {options}".format(
+            executable=executable,
+            options=options
+        )
+
+    ### Start the engine
+    engine = libeng.engOpen(command)
+
+    return engine, libeng, libmx, version
+
+
+def load_libs(matlab_root):
+    """Load and configure `libeng` and `libmx`, check MATLAB version.
+
+    The libraries are loaded only once per process and MATLAB root.
+
+    Returns
+    -------
+    libeng
+    libmx
+    version
+    executable : str or None
+        MATLAB executable used to start the engine (None on
+        Windows).
 
     """
+    with libs_cache_lock:
+        if matlab_root not in libs_cache:
+            libs_cache[matlab_root] = load_libs_uncached(matlab_root)
+
+    return libs_cache[matlab_root]
+
+
+def load_libs_uncached(matlab_root):
     if sys.maxsize > 2**32:
         bits = '64bit'
     else:
@@ -293,10 +1413,7 @@ def load_engine_and_libs(matlab_root, options):
             join(lib_dir, 'libmx.so')
         )
 
-        command = "{executable} {options}".format(
-            executable=join(matlab_root, 'bin', 'matlab'),
-            options=options
-        )
+        executable = join(matlab_root, 'bin', 'matlab')
 
         ### Check for /bin/csh
         if not os.path.exists("/bin/csh"):
@@ -317,7 +1434,7 @@ def load_engine_and_libs(matlab_root, options):
         libeng = Library('libeng')
         libmx = Library('libmx')
 
-        command = None
+        executable = None
 
     elif system == 'Darwin':
         if bits == '64bit':
@@ -334,17 +1451,14 @@ def load_engine_and_libs(matlab_root, options):
             join(lib_dir, 'libmx.dylib')
         )
 
-        command = "{executable} {options}".format(
-            executable=join(matlab_root, 'bin', 'matlab'),
-            options=options
-        )
+        executable = join(matlab_root, 'bin', 'matlab')
 
     else:
         unsupported_platform(system, bits)
 
     ### Check MATLAB version
     try:
-        version_str = c_char_p.in_dll(libeng, "libeng_version").value
+        version_str = to_str(c_char_p.in_dll(libeng, "libeng_version").value)
         version = tuple([int(v) for v in version_str.split('.')[:2]])
 
     except ValueError:
@@ -357,10 +1471,7 @@ def load_engine_and_libs(matlab_root, options):
     elif (system == 'Darwin') and (version == (8, 3)) and (bits == '64bit'):
         warnings.warn("You are using MATLAB version 8.3 (R2014a) on OS X, which appears to have a bug in engGetVariable().  You will only be able to use arrays of type double.")
 
-    ### Start the engine
-    engine = libeng.engOpen(command)
-
-    return engine, libeng, libmx, version
+    return libeng, libmx, version, executable
 
 
 def check_python_matlab_architecture(bits, lib_dir):
@@ -394,7 +1505,7 @@ class Workspace(object):
       sorted,idx = workspace.sort([3,1,2], nout=2)
 
     """
-    def __init__(self, session_ref):
+    def __init__(self, session_ref, check_mtime=False):
         """Workspace constructor.
 
         Parameters
@@ -403,17 +1514,83 @@ class Workspace(object):
             We need weak reference here, because Workspace is an
             attribute of MatlabSession and we do not want cyclic
             referencing.
+        check_mtime : bool, optional
+            If True, then cached functions defined in M-files are
+            resolved again, when the file is modified.
 
         """
         self._session_ref = session_ref
+        self._check_mtime = check_mtime
+
+        ### Resolved functions: {name: (MatlabFunction, path, mtime)}
+        self._functions = {}
+
+
+    def invalidate(self, names=None):
+        """Forget resolved function names.
+
+        Function names are resolved only once and cached.  The cache
+        is cleared automatically after changing the directory or
+        MATLAB path with `MatlabSession.eval()`, but it has to be
+        invalidated explicitly, if it changes in any other way.
+
+        Parameters
+        ----------
+        names : iterable of str or None, optional
+            Names to be forgotten.  If `None`, then the whole cache
+            is cleared.
+
+        """
+        if names is None:
+            self._functions.clear()
+        else:
+            for name in names:
+                self._functions.pop(name, None)
+
+
+    def _resolve_mfile(self, name):
+        """Return path and modification time of M-file `name` (or
+        `(None, None)` if not applicable).
+
+        """
+        session = self._session_ref()
+        tmp = session._temp_name('PATH')
+
+        with session._lock:
+            session._eval_internal("{} = which('{}');".format(tmp, name))
+            path = session.get(tmp)
+            session._eval_internal("clear {}".format(tmp), check=False)
+
+        mtime = mtime_or_none(path) if path else None
+
+        if mtime is None:
+            path = None
+
+        return path, mtime
+
 
     def __getattr__(self, attr):
 
+        ### Cached function names
+        if attr in self._functions:
+            func, path, mtime = self._functions[attr]
+
+            if (path is None) or (mtime_or_none(path) == mtime):
+                self._session_ref()._stats.record('lookup_cached', name=attr)
+                return func
+
+
         session = self._session_ref()
+        tmp = session._temp_name('KIND')
+
+        t0 = timer()
+
+        with session._lock:
+            session._eval_internal("{} = exist('{}')".format(tmp, attr))
+            kind = session.get(tmp)
+            session._eval_internal("clear {}".format(tmp), check=False)
 
-        session.eval("KIND__ = exist('{}')".format(attr))
-        kind = session.get('KIND__')
-        session.eval("clear KIND__")
+        session._stats.record('lookup', name=attr, transport=timer()-t0)
 
         if kind == 0:
             raise RuntimeError("No such variable/function in MATLAB workspace: {}".format(attr))
@@ -424,6 +1601,13 @@ class Workspace(object):
         elif kind in (2, 3, 5, 6): # Function
             out = MatlabFunction(name=attr, session_ref=self._session_ref)
 
+            if self._check_mtime and (kind == 2):
+                path, mtime = self._resolve_mfile(attr)
+            else:
+                path, mtime = None, None
+
+            self._functions[attr] = (out, path, mtime)
+
         else:
             raise NotImplementedError("Unknown variable/function type in MATLAB workspace: {}".format(attr))
 
@@ -440,6 +1624,16 @@ class Workspace(object):
 
 
 
+def mtime_or_none(path):
+    """Return modification time of `path` or None if not accessible."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    return mtime
+
+
+
 class MatlabFunction(object):
     def __init__(self, name, session_ref):
         self.name = name
@@ -447,57 +1641,139 @@ class MatlabFunction(object):
 
 
     def __call__(self, *args, **kwargs):
-        session = self._session_ref()
+        """Call the MATLAB function with `args`.
 
+        Keyword arguments: `nout` is the number of outputs (default
+        1), `timeout` kills MATLAB engine and raises TimeoutError if
+        the call takes longer than `timeout` seconds.
+
+        """
+        session = self._session_ref()
 
-        ### Left-hand side (returns) string
         nout = kwargs.get('nout', 1)
-        outs = ["OUT{}__".format(i) for i in range(nout)]
-        outs_str = ','.join(outs)
+        timeout = kwargs.get('timeout', None)
+
+        if timeout is not None:
+            return session._run_with_timeout(
+                lambda: self(*args, nout=nout),
+                timeout
+            )
+
+        with session.tracer.span(self.name, 'call', nargs=len(args), nout=nout):
+            ret = self._call(session, args, nout)
+
+        return ret
+
+
+    def _call(self, session, args, nout):
+        libeng = session._libeng
+        libmx = session._libmx
+        tracer = session.tracer
+
+        transport = 0.
+        conversion = 0.
+        counter = ByteCounter()
+
+        n = session._temp_number()
+        args_name = 'ARGS{}__'.format(n)
+        ret_name = 'RET{}__'.format(n)
 
 
-        ### Right hand side (arguments) string
-        ins = []
-        for i,a in enumerate(args):
-            aname = "ARG{}__".format(i)
-            session.put(aname, a)
-            ins.append(aname)
-        ins_str = ','.join(ins)
+        ### Put all arguments in a single cell array (converted
+        ### without holding the engine lock)
+        if args:
+            t0 = timer()
+
+            dim = (mwSize*2)(1, len(args))
+            pm = libmx.mxCreateCellArray(2, dim)
+
+            try:
+                for i,a in enumerate(args):
+                    with tracer.span('ndarray_to_mxarray', 'conversion', argument=i):
+                        p = ndarray_to_mxarray(libmx, a, tracer=tracer, counter=counter)
+                        libmx.mxSetCell(pm, i, p)
+            except Exception:
+                ### Destroys the arguments converted so far
+                libmx.mxDestroyArray(pm)
+                raise
+
+            conversion += timer() - t0
+
+            ins_str = args_name + '{:}'
+        else:
+            pm = None
+            ins_str = ''
 
 
         ### MATLAB command
-        if outs:
-            cmd = "[{outs}] = {name}({ins})".format(
-                outs=outs_str,
+        if nout > 0:
+            call = "[OUT{n}__{{:}}] = {name}({ins});".format(
+                n=n,
                 name=self.name,
                 ins=ins_str
             )
         else:
-            cmd = "{name}({ins})".format(
+            call = "{name}({ins})".format(
                 name=self.name,
                 ins=ins_str
             )
 
 
-        ### Run the function
-        session.eval(cmd)
+        with session._lock:
+            session._check_engine()
 
+            t0 = timer()
 
-        ### Clear input variables in MATLAB
-        if ins:
-            session.eval("clear {}".format(' '.join(ins)))
+            if pm is not None:
+                try:
+                    with tracer.span('engPutVariable', 'engine', name=args_name):
+                        libeng.engPutVariable(session._ep, args_name, pm)
+                finally:
+                    libmx.mxDestroyArray(pm)
 
 
-        ### Get the resulst from MATLAB
-        rets = []
-        for o in outs:
-            r = session.get(o)
-            rets.append(r)
+            ### Run the function (RET{n}__ stays in the workspace until
+            ### the next engine operation, which saves a round trip)
+            with tracer.span('engEvalString', 'engine', expression=call):
+                libeng.engEvalString(
+                    session._ep,
+                    call_script.format(n=n, nout=nout, call=call, stale=session._stale_ret)
+                )
+
+            session._stale_ret = ret_name
+
 
+            ### Get the error string and the results from MATLAB
+            with tracer.span('engGetVariable', 'engine', name=ret_name):
+                pm = libeng.engGetVariable(session._ep, ret_name)
 
-        ### Clear the resutls in MATLAB
-        if outs:
-            session.eval("clear {}".format(' '.join(outs)))
+        t1 = timer()
+
+        error_string = mxarray_to_ndarray(libmx, libmx.mxGetCell(pm, 0))
+
+        rets = []
+        if error_string == "":
+            for i in range(nout):
+                with tracer.span('mxarray_to_ndarray', 'conversion', output=i):
+                    r = mxarray_to_ndarray(libmx, libmx.mxGetCell(pm, i+1), tracer=tracer, counter=counter)
+                rets.append(r)
+
+        libmx.mxDestroyArray(pm)
+
+        transport += t1 - t0
+        conversion += timer() - t1
+
+        session._stats.record(
+            'call',
+            name=self.name,
+            transport=transport,
+            conversion=conversion,
+            nbytes=counter.nbytes,
+            error=(error_string != "")
+        )
+
+        if error_string != "":
+            raise RuntimeError("Error from MATLAB\n{0}".format(error_string))
 
 
         ### Return the results
@@ -512,21 +1788,109 @@ class MatlabFunction(object):
     def __doc__(self):
 
         session = self._session_ref()
+        tmp = session._temp_name('DOC')
 
-        session.eval(
-            "DOC__ = help('{}')".format(self.name)
-        )
+        with session._lock:
+            session._eval_internal(
+                "{} = help('{}')".format(tmp, self.name)
+            )
 
-        doc = session.get('DOC__')
+            doc = session.get(tmp)
 
-        session.eval("clear DOC__")
+            session._eval_internal("clear {}".format(tmp), check=False)
 
         return doc
 
 
 
-def mxarray_to_ndarray(libmx, pm):
-    """Convert MATLAB object `pm` to numpy equivalent."""
+class MxArrayOwner(object):
+    """Keep an mxArray alive as long as there are references to it.
+
+    Arrays returned by `mxarray_to_ndarray` with the `owner` argument
+    share memory with the mxArray.  They hold a reference to the owner
+    object, which destroys the mxArray when garbage collected.
+
+    """
+    def __init__(self, libmx, pm):
+        self._libmx = libmx
+        self._pm = pm
+
+    def __del__(self):
+        self._libmx.mxDestroyArray(self._pm)
+
+
+
+def ndarray_from_pointer(pointer, shape, dtype, owner=None, copy=True):
+    """Create Fortran ordered ndarray from MATLAB data at `pointer`.
+
+    If `copy` is True, then the data is copied.  Otherwise, the array
+    shares memory with the mxArray and keeps `owner` alive.  Without
+    an `owner`, the array is valid only as long as the mxArray
+    exists.
+
+    """
+    dtype = np.dtype(dtype)
+    datasize = int(np.prod(shape)) * dtype.itemsize
+    address = ctypes.cast(pointer, c_void_p).value
+
+    if copy or (datasize == 0):
+        buf = ctypes.create_string_buffer(datasize)
+        ctypes.memmove(buf, pointer, datasize)
+    else:
+        buf = (ctypes.c_char * datasize).from_address(address)
+        buf._owner = owner
+
+    pyarray = np.ndarray(
+        buffer=buf,
+        shape=shape,
+        dtype=dtype,
+        order='F'
+    )
+
+    return pyarray
+
+
+
+def ndarray_to_pointer(arr, pointer):
+    """Copy `arr` into MATLAB data at `pointer` in Fortran order.
+
+    Fortran contiguous arrays are copied directly from their buffer,
+    all other arrays are copied element-wise (strided) into the
+    MATLAB buffer.  No intermediate copy is made in either case.
+
+    """
+    if arr.size == 0:
+        return
+
+    if arr.flags.f_contiguous:
+        ctypes.memmove(pointer, arr.ctypes.data, arr.nbytes)
+
+    else:
+        address = ctypes.cast(pointer, c_void_p).value
+        buf = (ctypes.c_char * arr.nbytes).from_address(address)
+
+        mat_array = np.ndarray(
+            buffer=buf,
+            shape=arr.shape,
+            dtype=arr.dtype,
+            order='F'
+        )
+        mat_array[...] = arr
+
+
+
+def mxarray_to_ndarray(libmx, pm, owner=None, tracer=null_tracer, counter=None):
+    """Convert MATLAB object `pm` to numpy equivalent.
+
+    If `owner` (MxArrayOwner) is given, then real numeric and logical
+    arrays share memory with `pm` instead of being copied.  Conversion
+    of each cell and struct element is recorded by `tracer`.  Bytes
+    of numeric, logical and char data are added to `counter`
+    (ByteCounter).
+
+    """
+    ### Per-element spans are skipped without a tracer
+    tracing = tracer is not null_tracer
 
     ndims = libmx.mxGetNumberOfDimensions(pm)
     dims = libmx.mxGetDimensions(pm)
@@ -538,30 +1902,46 @@ def mxarray_to_ndarray(libmx, pm):
     data = libmx.mxGetData(pm)
     imag_data = libmx.mxGetImagData(pm)
 
+    if (counter is not None) and (class_name not in ('cell', 'struct')):
+        counter.nbytes += numelems * elem_size * (2 if is_complex else 1)
+
+
+    if is_numeric and is_complex:
+        ### Fill a single complex array directly from MATLAB memory
+        if class_name == 'single':
+            complex_dtype = 'complex64'
+        else:
+            complex_dtype = 'complex128'
 
-    if is_numeric:
-        datasize = numelems*elem_size
+        pyarray = np.empty(dims[:ndims], dtype=complex_dtype, order='F')
 
-        real_buffer = ctypes.create_string_buffer(datasize)
-        ctypes.memmove(real_buffer, data, datasize)
-        pyarray = np.ndarray(
-            buffer=real_buffer,
+        pyarray.real = ndarray_from_pointer(
+            data,
             shape=dims[:ndims],
             dtype=class_name,
-            order='F'
+            copy=False
+        )
+        pyarray.imag = ndarray_from_pointer(
+            imag_data,
+            shape=dims[:ndims],
+            dtype=class_name,
+            copy=False
         )
 
-        if is_complex:
-            imag_buffer = ctypes.create_string_buffer(datasize)
-            ctypes.memmove(imag_buffer, imag_data, datasize)
-            pyarray_imag = np.ndarray(
-                buffer=imag_buffer,
-                shape=dims[:ndims],
-                dtype=class_name,
-                order='F'
-            )
+        out = pyarray.squeeze()
+
+        if out.ndim == 0:
+            out, = np.atleast_1d(out)
+
 
-            pyarray = pyarray + pyarray_imag * 1j
+    elif is_numeric:
+        pyarray = ndarray_from_pointer(
+            data,
+            shape=dims[:ndims],
+            dtype=class_name,
+            owner=owner,
+            copy=(owner is None)
+        )
 
         out = pyarray.squeeze()
 
@@ -575,20 +1955,16 @@ def mxarray_to_ndarray(libmx, pm):
         pystring = ctypes.create_string_buffer(datasize+1)
         libmx.mxGetString(pm, pystring, datasize)
 
-        out = pystring.value
+        out = to_str(pystring.value)
 
 
     elif class_name == 'logical':
-        datasize = numelems*elem_size
-
-        buf = ctypes.create_string_buffer(datasize)
-        ctypes.memmove(buf, data, datasize)
-
-        pyarray = np.ndarray(
-            buffer=buf,
+        pyarray = ndarray_from_pointer(
+            data,
             shape=dims[:ndims],
             dtype='bool',
-            order='F'
+            owner=owner,
+            copy=(owner is None)
         )
 
         out = pyarray.squeeze()
@@ -601,8 +1977,11 @@ def mxarray_to_ndarray(libmx, pm):
         for i in range(numelems):
             cell = libmx.mxGetCell(pm, i)
 
-            if bool(cell):
-                out[i] = mxarray_to_ndarray(libmx, cell)
+            if bool(cell) and tracing:
+                with tracer.span('cell', 'conversion', index=i):
+                    out[i] = mxarray_to_ndarray(libmx, cell, owner=owner, tracer=tracer, counter=counter)
+            elif bool(cell):
+                out[i] = mxarray_to_ndarray(libmx, cell, owner=owner, counter=counter)
             else:
                 ### uninitialized cell
                 out[i] = None
@@ -627,8 +2006,11 @@ def mxarray_to_ndarray(libmx, pm):
             for field_name in field_names:
                 field = libmx.mxGetField(pm, i, field_name)
 
-                if bool(field):
-                    el = mxarray_to_ndarray(libmx, field)
+                if bool(field) and tracing:
+                    with tracer.span('struct', 'conversion', index=i, field=field_name):
+                        el = mxarray_to_ndarray(libmx, field, owner=owner, tracer=tracer, counter=counter)
+                elif bool(field):
+                    el = mxarray_to_ndarray(libmx, field, owner=owner, counter=counter)
                 else:
                     ### uninitialized cell
                     el = None
@@ -671,11 +2053,77 @@ def mxarray_to_ndarray(libmx, pm):
 
 
 
-def ndarray_to_mxarray(libmx, arr):
+def loadmat_to_ndarray(value):
+    """Convert `value` loaded by `scipy.io.loadmat()` (not squeezed,
+    MATLAB dtypes) to the same types as returned by
+    `mxarray_to_ndarray()`.
+
+    """
+    if not isinstance(value, np.ndarray):
+        ### e.g. sparse matrices
+        return value
+
+    if value.dtype.names is not None:
+        field_names = list(value.dtype.names)
+        flat = value.ravel(order='F')
+
+        new_arrays = []
+        for field_name in field_names:
+            arr = [loadmat_to_ndarray(el[field_name]) for el in flat]
+
+            if np.any([isinstance(el, np.ndarray) for el in arr]):
+                newarr = np.empty(len(arr), dtype='O')
+                for i,a in enumerate(arr):
+                    newarr[i] = a
+            else:
+                newarr = np.array(arr)
+
+            new_arrays.append(newarr)
+
+        if new_arrays and flat.size > 0:
+            out = np.rec.fromarrays(new_arrays, names=field_names)
+            out = out.reshape(value.shape, order='F')
+            out = out.squeeze()
+        else:
+            out = np.array([])
+
+    elif value.dtype.kind == 'O':
+        flat = value.ravel(order='F')
+
+        out = np.empty(flat.size, dtype='O')
+        for i,el in enumerate(flat):
+            out[i] = loadmat_to_ndarray(el)
+
+        out = out.reshape(value.shape, order='F')
+        out = out.squeeze()
+
+    elif value.dtype.kind in ('U', 'S'):
+        ### Characters in column-major order as from mxGetString()
+        out = str(''.join(value.ravel(order='F')))
+
+    else:
+        out = value.squeeze()
+
+        if out.ndim == 0:
+            out, = np.atleast_1d(out)
+
+    return out
+
+
+
+
+def ndarray_to_mxarray(libmx, arr, tracer=null_tracer, counter=None):
+    """Convert `arr` to MATLAB object.  Conversion of each cell and
+    struct element is recorded by `tracer`.  Bytes of numeric,
+    logical and char data are added to `counter` (ByteCounter).
+
+    """
+    ### Per-element spans are skipped without a tracer
+    tracing = tracer is not null_tracer
 
     ### Prepare `arr` object (convert to ndarray if possible), assert
     ### data type
-    if isinstance(arr, str) or isinstance(arr, unicode):
+    if isinstance(arr, (bytes, unicode)):
         pass
 
     elif isinstance(arr, dict):
@@ -687,10 +2135,10 @@ def ndarray_to_mxarray(libmx, arr):
     elif ('pandas' in sys.modules) and isinstance(arr, sys.modules['pandas'].Series):
         arr = arr.to_frame().to_records()
 
-    elif isinstance(arr, collections.Iterable):
+    elif isinstance(arr, Iterable):
         arr = np.array(arr, ndmin=2)
 
-    elif np.issctype(type(arr)):
+    elif isinstance(arr, (numbers.Number, np.generic)):
         arr = np.array(arr, ndmin=2)
 
     else:
@@ -700,17 +2148,24 @@ def ndarray_to_mxarray(libmx, arr):
 
 
     ### Convert ndarray to mxarray
-    if isinstance(arr, str):
+    if isinstance(arr, (bytes, unicode)):
         pm = libmx.mxCreateString(arr)
 
-    elif isinstance(arr, unicode):
-        pm = libmx.mxCreateString(arr.encode('utf-8'))
+        if counter is not None:
+            counter.nbytes += libmx.mxGetNumberOfElements(pm) * libmx.mxGetElementSize(pm)
 
     elif isinstance(arr, np.ndarray) and arr.dtype.kind in ['i','u','f','c']:
         dim = arr.ctypes.shape_as(mwSize)
         complex_flag = (arr.dtype.kind == 'c')
 
-        pm = libmx.mxCreateNumericArray(
+        ### Uninitialized arrays are not zero-filled by MATLAB (the
+        ### data is overwritten anyway)
+        if libmx.has_uninit_arrays:
+            create_numeric_array = libmx.mxCreateUninitNumericArray
+        else:
+            create_numeric_array = libmx.mxCreateNumericArray
+
+        pm = create_numeric_array(
             arr.ndim,
             dim,
             dtype_to_mat(arr.dtype),
@@ -718,13 +2173,14 @@ def ndarray_to_mxarray(libmx, arr):
         )
 
         mat_data = libmx.mxGetData(pm)
-        np_data = arr.real.tostring('F')
-        ctypes.memmove(mat_data, np_data, len(np_data))
+        ndarray_to_pointer(arr.real, mat_data)
 
         if complex_flag:
             mat_data = libmx.mxGetImagData(pm)
-            np_data = arr.imag.tostring('F')
-            ctypes.memmove(mat_data, np_data, len(np_data))
+            ndarray_to_pointer(arr.imag, mat_data)
+
+        if counter is not None:
+            counter.nbytes += arr.nbytes
 
 
     elif isinstance(arr, np.ndarray) and arr.dtype.kind == 'b':
@@ -733,8 +2189,10 @@ def ndarray_to_mxarray(libmx, arr):
         pm = libmx.mxCreateLogicalArray(arr.ndim, dim)
 
         mat_data = libmx.mxGetData(pm)
-        np_data = arr.real.tostring('F')
-        ctypes.memmove(mat_data, np_data, len(np_data))
+        ndarray_to_pointer(arr, mat_data)
+
+        if counter is not None:
+            counter.nbytes += arr.nbytes
 
 
     elif isinstance(arr, np.ndarray) and arr.dtype.kind in ('O', 'S', 'U'):
@@ -743,7 +2201,11 @@ def ndarray_to_mxarray(libmx, arr):
         pm = libmx.mxCreateCellArray(arr.ndim, dim)
 
         for i,el in enumerate(arr.flatten('F')):
-            p = ndarray_to_mxarray(libmx, el)
+            if tracing:
+                with tracer.span('cell', 'conversion', index=i):
+                    p = ndarray_to_mxarray(libmx, el, tracer=tracer, counter=counter)
+            else:
+                p = ndarray_to_mxarray(libmx, el, counter=counter)
             libmx.mxSetCell(pm, i, p)
 
 
@@ -752,7 +2214,7 @@ def ndarray_to_mxarray(libmx, arr):
 
         name_num = len(arr.dtype.names)
 
-        names_p = (c_char_p*name_num)(*[c_char_p(name) for name in arr.dtype.names])
+        names_p = (c_char_p*name_num)(*[c_char_p(to_bytes(name)) for name in arr.dtype.names])
 
         pm = libmx.mxCreateStructArray(
             arr.ndim,
@@ -764,7 +2226,11 @@ def ndarray_to_mxarray(libmx, arr):
         for i,record in enumerate(arr.flatten('F')):
             for name in arr.dtype.names:
                 el = record[name]
-                p = ndarray_to_mxarray(libmx, el)
+                if tracing:
+                    with tracer.span('struct', 'conversion', index=i, field=name):
+                        p = ndarray_to_mxarray(libmx, el, tracer=tracer, counter=counter)
+                else:
+                    p = ndarray_to_mxarray(libmx, el, counter=counter)
 
                 libmx.mxSetField(pm, i, name, p)
 
@@ -779,35 +2245,44 @@ class Library(object):
     """Shared library proxy.
 
     The purpouse of this class is to wrap CDLL objects and append
-    `_730` to function names on the fly.  It should resolve the int vs
-    mwSize problems for those functions.
+    `_730` to function names.  It should resolve the int vs mwSize
+    problems for those functions.  Each function is looked up only
+    once and then bound as an instance attribute.
 
     It also initializes library functions by setting `artypes`,
     `restype` and `errcheck` attributes.
 
+    Attributes
+    ----------
+    has_uninit_arrays : bool
+        True if libmx provides `mxCreateUninitNumericArray()`
+        (MATLAB R2015a and newer).
+
     """
     def __init__(self, name, **kwargs):
         self._lib = ctypes.CDLL(name, **kwargs)
 
+        self.has_uninit_arrays = False
+
         if 'libeng' in name:
 
-            self.engOpen.argtypes = (c_char_p,)
+            self.engOpen.argtypes = (c_string,)
             self.engOpen.restype = POINTER(Engine)
             self.engOpen.errcheck = error_check
 
-            self.engPutVariable.argtypes = (POINTER(Engine), c_char_p, POINTER(mxArray))
+            self.engPutVariable.argtypes = (POINTER(Engine), c_string, POINTER(mxArray))
             self.engPutVariable.restype = c_int
             self.engPutVariable.errcheck = error_check
 
-            self.engGetVariable.argtypes = (POINTER(Engine), c_char_p)
+            self.engGetVariable.argtypes = (POINTER(Engine), c_string)
             self.engGetVariable.restype = POINTER(mxArray)
             self.engGetVariable.errcheck = error_check
 
-            self.engEvalString.argtypes = (POINTER(Engine), c_char_p)
+            self.engEvalString.argtypes = (POINTER(Engine), c_string)
             self.engEvalString.restype = c_int
             self.engEvalString.errcheck = error_check
 
-            self.engOutputBuffer.argtypes = (POINTER(Engine), c_char_p, c_int)
+            self.engOutputBuffer.argtypes = (POINTER(Engine), c_string, c_int)
             self.engOutputBuffer.restype = c_int
             self.engOutputBuffer.errcheck = error_check
 
@@ -831,6 +2306,7 @@ class Library(object):
 
             self.mxGetClassName.argtypes = (POINTER(mxArray),)
             self.mxGetClassName.restype = c_char_p
+            self.mxGetClassName.errcheck = string_check
 
             self.mxIsNumeric.argtypes = (POINTER(mxArray),)
             self.mxIsNumeric.restype = c_bool
@@ -863,14 +2339,14 @@ class Library(object):
 
             self.mxGetFieldNameByNumber.argtypes = (POINTER(mxArray), c_int)
             self.mxGetFieldNameByNumber.restype = c_char_p
-            self.mxGetFieldNameByNumber.errcheck = error_check
+            self.mxGetFieldNameByNumber.errcheck = string_check
 
-            self.mxGetField.argtypes = (POINTER(mxArray), mwIndex, c_char_p)
+            self.mxGetField.argtypes = (POINTER(mxArray), mwIndex, c_string)
             self.mxGetField.restype = POINTER(mxArray)
             ### Errors has to be handled elswhere, because of NULL on uninitialized fields
             # self.mxGetField.errcheck = error_check
 
-            self.mxSetField.argtypes = (POINTER(mxArray), mwIndex, c_char_p, POINTER(mxArray))
+            self.mxSetField.argtypes = (POINTER(mxArray), mwIndex, c_string, POINTER(mxArray))
             self.mxSetField.restype = None
 
             self.mxCreateStructArray.argtypes = (mwSize, POINTER(mwSize), c_int, POINTER(c_char_p))
@@ -878,14 +2354,17 @@ class Library(object):
             self.mxCreateStructArray.errcheck = error_check
 
             self.mxArrayToString.argtypes = (POINTER(mxArray),)
-            self.mxArrayToString.restype = c_char_p
+            self.mxArrayToString.restype = c_void_p
             self.mxArrayToString.errcheck = error_check
 
-            self.mxCreateString.argtypes = (c_char_p,)
+            self.mxFree.argtypes = (c_void_p,)
+            self.mxFree.restype = None
+
+            self.mxCreateString.argtypes = (c_string,)
             self.mxCreateString.restype = POINTER(mxArray)
             self.mxCreateString.errcheck = error_check
 
-            self.mxGetString.argtypes = (POINTER(mxArray), c_char_p, mwSize)
+            self.mxGetString.argtypes = (POINTER(mxArray), c_string, mwSize)
             self.mxGetString.restype = c_int
             self.mxGetString.errcheck = error_check
 
@@ -893,6 +2372,12 @@ class Library(object):
             self.mxCreateNumericArray.restype = POINTER(mxArray)
             self.mxCreateNumericArray.errcheck = error_check
 
+            if self.has_function('mxCreateUninitNumericArray'):
+                self.mxCreateUninitNumericArray.argtypes = (mwSize, POINTER(mwSize), c_int, c_int)
+                self.mxCreateUninitNumericArray.restype = POINTER(mxArray)
+                self.mxCreateUninitNumericArray.errcheck = error_check
+                self.has_uninit_arrays = True
+
             self.mxCreateLogicalArray.argtypes = (mwSize, POINTER(mwSize))
             self.mxCreateLogicalArray.restype = POINTER(mxArray)
             self.mxCreateLogicalArray.errcheck = error_check
@@ -909,6 +2394,16 @@ class Library(object):
 
 
 
+    def has_function(self, name):
+        """Check whether the library exports function `name`."""
+        try:
+            getattr(self, name)
+        except AttributeError:
+            return False
+        return True
+
+
+
     def __getattr__(self, attr):
 
         attr730 = attr + '_730'
@@ -918,4 +2413,9 @@ class Library(object):
         except AttributeError:
             out = getattr(self._lib, attr)
 
+        ### Bind the function to the instance, so that the lookup
+        ### happens only once (all configured functions are bound in
+        ### the constructor)
+        setattr(self, attr, out)
+
         return out
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function, division, absolute_import
+
+import threading
+import collections
+
+from matlab_wrapper.matlab_session import MatlabSession
+
+
+### Delay before starting MATLAB again after a failed start, doubled
+### after each further failure up to `max_retry_delay` seconds
+retry_delay = 1.
+max_retry_delay = 60.
+
+
+class EnginePrewarmer(object):
+    """Keep MATLAB sessions started in the background.
+
+    MATLAB takes several seconds to start.  The prewarmer starts
+    `size` sessions in a background thread and hands them over
+    instantly with `session()`.  A new session is started whenever
+    one is taken.  Failed starts are retried with increasing
+    delays::
+
+      prewarmer = EnginePrewarmer(2, init_script="addpath('~/mfiles')")
+
+      matlab = prewarmer.session()  # no waiting for MATLAB
+
+      prewarmer.close()
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of idle sessions kept ready.
+    init_script : str or None, optional
+        MATLAB code evaluated in each new session before it is handed
+        over, e.g. `addpath()` or `pkg load`.
+    **kwargs
+        Passed to `MatlabSession`.
+
+    Methods
+    -------
+    session()
+    close()
+
+    """
+    def __init__(self, size=1, init_script=None, **kwargs):
+
+        if size < 1:
+            raise ValueError("Number of prewarmed sessions must be positive: {}".format(size))
+
+        self.size = size
+        self.init_script = init_script
+        self._kwargs = kwargs
+
+        self._sessions = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._error = None
+
+        self._thread = threading.Thread(target=self._refill)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+
+    def _start_session(self):
+        session = MatlabSession(**self._kwargs)
+
+        if self.init_script is not None:
+            session.eval(self.init_script)
+
+        return session
+
+
+
+    def _refill(self):
+        """Background thread: keep `size` sessions ready."""
+        delay = retry_delay
+
+        while True:
+            with self._condition:
+                while (not self._closed) and (len(self._sessions) >= self.size):
+                    self._condition.wait()
+
+                if self._closed:
+                    return
+
+            try:
+                session = self._start_session()
+            except Exception as e:
+                ### Waiting callers get the error, the start is
+                ### retried later (or as soon as closed)
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+                    self._condition.wait(delay)
+
+                delay = min(2 * delay, max_retry_delay)
+                continue
+
+            delay = retry_delay
+
+            with self._condition:
+                if self._closed:
+                    return
+                self._error = None
+                self._sessions.append(session)
+                self._condition.notify_all()
+
+
+
+    def session(self):
+        """Return a started session.
+
+        Blocks only if no prewarmed session is ready yet.  Raises
+        the error of the last start, if it failed and no session is
+        ready.
+
+        """
+        with self._condition:
+            while not self._sessions:
+                if self._error is not None:
+                    raise self._error
+
+                if self._closed:
+                    raise RuntimeError("EnginePrewarmer was closed.")
+
+                self._condition.wait()
+
+            session = self._sessions.popleft()
+            self._condition.notify_all()
+
+        return session
+
+
+
+    def close(self):
+        """Stop starting new sessions and close the idle ones."""
+        with self._condition:
+            self._closed = True
+            self._sessions.clear()
+            self._condition.notify_all()
+
+
+
+    def __repr__(self):
+        r = '<EnginePrewarmer:{size}>'.format(size=self.size)
+
+        return r
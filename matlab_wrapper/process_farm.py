@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""MATLAB sessions in worker processes with shared memory array
+hand-off (Python 3.8+ only).
+
+"""
+
+import collections
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from matlab_wrapper.matlab_session import MatlabSession
+
+
+### Arrays of at least that many bytes are passed through shared
+### memory, smaller ones are pickled
+default_shared_threshold = 65536
+
+
+### Array stored in a shared memory segment
+SharedArray = collections.namedtuple(
+    'SharedArray',
+    ['name', 'shape', 'dtype', 'order']
+)
+
+
+class MatlabProcessFarm(object):
+    """MATLAB sessions running in worker processes.
+
+    Each worker process owns one `MatlabSession`, so that the
+    conversions between MATLAB and numpy are not limited by the GIL
+    of a single process.  Large numeric arrays (arguments and
+    results) are passed between the processes through shared memory
+    instead of being pickled::
+
+      with MatlabProcessFarm(4, options='-nojvm') as farm:
+          ys = farm.map('fft', images)
+
+          future = farm.submit('svd', a, nout=3)
+          u, s, v = future.result()
+
+    Parameters
+    ----------
+    size : int
+        Number of worker processes (MATLAB engines).
+    init_script : str or None, optional
+        MATLAB code evaluated in each worker session, e.g. `addpath()`.
+    shared_threshold : int, optional
+        Numeric arrays of at least `shared_threshold` bytes are
+        passed through shared memory.
+    **kwargs
+        Passed to `MatlabSession`.
+
+    Methods
+    -------
+    submit(func_name, *args, nout=1)
+    map(func_name, iterable, nout=1)
+    close()
+
+    """
+    def __init__(self, size, init_script=None, shared_threshold=default_shared_threshold, **kwargs):
+
+        if size < 1:
+            raise ValueError("Number of worker processes must be positive: {}".format(size))
+
+        self.size = size
+        self.shared_threshold = shared_threshold
+
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=size,
+            initializer=_init_worker,
+            initargs=(kwargs, init_script, shared_threshold),
+        )
+
+
+
+    def submit(self, func_name, *args, **kwargs):
+        """Schedule MATLAB function `func_name` to be called with `args`
+        in one of the workers.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the result(s) of the function (`nout` keyword
+            argument sets the number of outputs).
+
+        """
+        nout = kwargs.get('nout', 1)
+
+        segments = []
+        try:
+            encoded = [encode(a, self.shared_threshold, segments) for a in args]
+            inner = self._executor.submit(_call, func_name, encoded, nout)
+        except Exception:
+            release(segments)
+            raise
+
+        outer = concurrent.futures.Future()
+
+        def done(inner):
+            ### Arguments are not needed anymore after the call
+            release(segments)
+
+            try:
+                outer.set_result(decode(inner.result()))
+            except Exception as e:
+                outer.set_exception(e)
+
+        inner.add_done_callback(done)
+
+        return outer
+
+
+
+    def map(self, func_name, iterable, nout=1):
+        """Call MATLAB function `func_name` for each element of
+        `iterable` using all workers in parallel.
+
+        Tuples in `iterable` are passed as multiple arguments,
+        anything else as a single argument.  Returns a list of results
+        in the same order as `iterable`.
+
+        """
+        futures = []
+        for args in iterable:
+            if not isinstance(args, tuple):
+                args = (args,)
+            futures.append(self.submit(func_name, *args, nout=nout))
+
+        return [f.result() for f in futures]
+
+
+
+    def close(self):
+        """Shut down the worker processes (closes the MATLAB engines)."""
+        self._executor.shutdown(wait=True)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def __repr__(self):
+        r = '<MatlabProcessFarm:{size}>'.format(size=self.size)
+
+        return r
+
+
+
+
+def encode(value, threshold, segments):
+    """Replace large numeric arrays (possibly in a tuple) by
+    `SharedArray` descriptors.  New shared memory segments are
+    appended to `segments`.
+
+    """
+    if isinstance(value, tuple):
+        return tuple(encode(v, threshold, segments) for v in value)
+
+    ### Only plain numeric arrays: `dtype.str` of record arrays does
+    ### not describe their fields
+    if (not isinstance(value, np.ndarray)) or (value.dtype.kind not in 'biufc') or (value.nbytes < max(threshold, 1)):
+        return value
+
+    ### MATLAB uses Fortran order, keep it if possible
+    order = 'F' if value.flags.f_contiguous else 'C'
+
+    shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+    segments.append(shm)
+
+    view = np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf, order=order)
+    view[...] = value
+    del view
+
+    return SharedArray(shm.name, value.shape, value.dtype.str, order)
+
+
+
+def decode(value):
+    """Copy arrays out of shared memory and free the segments."""
+    if isinstance(value, tuple) and not isinstance(value, SharedArray):
+        return tuple(decode(v) for v in value)
+
+    if not isinstance(value, SharedArray):
+        return value
+
+    shm = shared_memory.SharedMemory(name=value.name)
+    try:
+        view = np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf, order=value.order)
+        arr = view.copy(order='A')
+        del view
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return arr
+
+
+
+def attach(value, attached):
+    """Replace `SharedArray` descriptors (possibly in a tuple) by
+    arrays viewing the shared memory.  Attached segments are appended
+    to `attached`.
+
+    """
+    if isinstance(value, SharedArray):
+        shm = shared_memory.SharedMemory(name=value.name)
+        attached.append(shm)
+        return np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf, order=value.order)
+
+    if isinstance(value, tuple):
+        return tuple(attach(v, attached) for v in value)
+
+    return value
+
+
+
+def release(segments):
+    for shm in segments:
+        shm.close()
+        shm.unlink()
+
+
+
+
+### Worker process state
+_session = None
+_shared_threshold = default_shared_threshold
+
+
+def _init_worker(kwargs, init_script, shared_threshold):
+    global _session, _shared_threshold
+
+    _session = MatlabSession(**kwargs)
+    _shared_threshold = shared_threshold
+
+    if init_script is not None:
+        _session.eval(init_script)
+
+
+
+def _call(func_name, encoded, nout):
+    """Run in a worker: call the function with arguments attached from
+    shared memory and put large results into new segments.
+
+    """
+    attached = []
+    args = []
+    try:
+        for a in encoded:
+            args.append(attach(a, attached))
+
+        func = getattr(_session.workspace, func_name)
+        result = func(*args, nout=nout)
+
+    finally:
+        ### Views must be gone before the segments can be closed
+        del args[:]
+        for shm in attached:
+            shm.close()
+
+    ### Segments are unlinked by the parent after copying
+    segments = []
+    try:
+        out = encode(result, _shared_threshold, segments)
+    except Exception:
+        release(segments)
+        raise
+
+    for shm in segments:
+        shm.close()
+
+    return out
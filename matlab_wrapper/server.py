@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Share MATLAB engines between processes through a Unix socket.
+
+Start the server::
+
+  python -m matlab_wrapper.server --socket /tmp/matlab.sock --size 4
+
+and connect from any number of processes::
+
+  matlab = MatlabClient('/tmp/matlab.sock')
+
+  matlab.put('a', np.arange(10.))
+  matlab.eval('b = a * 2')
+  b = matlab.get('b')
+  s = matlab.workspace.sin(b)
+
+Each connection gets its own session from the pool for its whole
+lifetime.  When a new connection takes over a session, all variables
+(including globals) and functions are cleared, open files are closed,
+the default MATLAB path is restored and the working directory is
+changed back to the initial one.  Other settings (e.g. `format`,
+warning states or the random number generator) are not reset and can
+leak between clients.
+
+The socket is only accessible by the user running the server.
+
+Messages consist of a 4 byte (big-endian) length, a JSON header and
+raw buffers of the numeric arrays referenced from the header.
+Nothing is pickled.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import json
+import socket
+import struct
+import argparse
+import threading
+import weakref
+
+import numpy as np
+
+from matlab_wrapper.matlab_session import MatlabFunction
+from matlab_wrapper.session_pool import MatlabSessionPool
+
+
+### Length prefix of the JSON header
+length_struct = struct.Struct('!I')
+
+
+### Run before a session is handed over to a new client
+reset_script = "clear all; fclose('all'); restoredefaultpath; cd('{path}');"
+
+
+class MatlabServer(object):
+    """Serve a pool of MATLAB sessions on a Unix socket.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Unix socket.
+    size : int, optional
+        Number of MATLAB sessions (concurrent connections).
+    **kwargs
+        Passed to `MatlabSession`.
+
+    Methods
+    -------
+    serve_forever()
+    close()
+
+    """
+    def __init__(self, path, size=1, **kwargs):
+        self.path = path
+        self.pool = MatlabSessionPool(size, **kwargs)
+
+        ### Initial working directories of the sessions
+        self._start_dirs = weakref.WeakKeyDictionary()
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(path)
+        os.chmod(path, 0o600)
+        self._socket.listen(size)
+
+        self._closed = False
+
+
+
+    def serve_forever(self):
+        """Accept connections (each in a new thread) until `close()`."""
+        while not self._closed:
+            try:
+                conn, _ = self._socket.accept()
+            except socket.error:
+                if self._closed:
+                    return
+                raise
+
+            thread = threading.Thread(target=self._handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+
+
+    def _handle(self, conn):
+        try:
+            with self.pool.session() as session:
+                ### Nothing from the previous client must be visible
+                if session not in self._start_dirs:
+                    self._start_dirs[session] = session.workspace.pwd()
+
+                session.eval(
+                    reset_script.format(path=self._start_dirs[session].replace("'", "''")),
+                    check=False
+                )
+
+                while True:
+                    try:
+                        header, buffers = recv_message(conn)
+                    except EOFError:
+                        break
+
+                    try:
+                        value = dispatch(session, header, decode_value(header.get('value'), buffers))
+                        response = {'ok': True}
+                    except Exception as e:
+                        value = None
+                        response = {
+                            'ok': False,
+                            'error': type(e).__name__,
+                            'message': str(e),
+                        }
+
+                    send_message(conn, response, value)
+
+        except socket.error:
+            pass
+
+        finally:
+            conn.close()
+
+
+
+    def close(self):
+        """Stop accepting connections and close idle sessions."""
+        self._closed = True
+
+        ### accept() does not return on close() on all platforms
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self._socket.close()
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.pool.close()
+
+
+
+    def __repr__(self):
+        r = '<MatlabServer:{path}>'.format(path=self.path)
+
+        return r
+
+
+
+
+def dispatch(session, header, value):
+    """Execute a single request in `session`."""
+    op = header['op']
+
+    if op == 'eval':
+        out = session.eval(header['expression'], check=header.get('check', True))
+
+    elif op == 'get':
+        out = session.get(header['name'])
+
+    elif op == 'put':
+        out = session.put(header['name'], value)
+
+    elif op == 'get_many':
+        out = session.get_many(header['names'])
+
+    elif op == 'put_many':
+        out = session.put_many(value)
+
+    elif op == 'call':
+        func = getattr(session.workspace, header['name'])
+        if not isinstance(func, MatlabFunction):
+            raise RuntimeError("Not a function: {}".format(header['name']))
+
+        out = func(*value, nout=header.get('nout', 1))
+
+    elif op == 'lookup':
+        out = getattr(session.workspace, header['name'])
+        if isinstance(out, MatlabFunction):
+            out = {'function': True}
+        else:
+            out = {'function': False, 'value': out}
+
+    else:
+        raise NotImplementedError("Unknown operation: {}".format(op))
+
+    return out
+
+
+
+
+class MatlabClient(object):
+    """Connection to `MatlabServer` with the interface of
+    `MatlabSession`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the server's Unix socket.
+
+    Methods
+    -------
+    eval(expression, check=True)
+    get(name)
+    put(name, value)
+    get_many(names)
+    put_many(mapping)
+    close()
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._lock = threading.Lock()
+
+        self.workspace = ClientWorkspace(self)
+
+
+
+    def _request(self, header, value=None):
+        with self._lock:
+            send_message(self._socket, header, value)
+            response, buffers = recv_message(self._socket)
+
+        if not response['ok']:
+            if response['error'] == 'NotImplementedError':
+                raise NotImplementedError(response['message'])
+            else:
+                raise RuntimeError(response['message'])
+
+        return decode_value(response.get('value'), buffers)
+
+
+
+    def eval(self, expression, check=True):
+        """See `MatlabSession.eval()`."""
+        self._request({'op': 'eval', 'expression': expression, 'check': check})
+
+
+    def get(self, name):
+        """See `MatlabSession.get()`."""
+        return self._request({'op': 'get', 'name': name})
+
+
+    def put(self, name, value):
+        """See `MatlabSession.put()`."""
+        self._request({'op': 'put', 'name': name}, value)
+
+
+    def get_many(self, names):
+        """See `MatlabSession.get_many()`."""
+        return self._request({'op': 'get_many', 'names': list(names)})
+
+
+    def put_many(self, mapping):
+        """See `MatlabSession.put_many()`."""
+        self._request({'op': 'put_many'}, dict(mapping))
+
+
+
+    def close(self):
+        """Close the connection (the session returns to the pool)."""
+        self._socket.close()
+
+
+    def __del__(self):
+        try:
+            self._socket.close()
+        except AttributeError:
+            pass
+
+
+    def __repr__(self):
+        r = '<MatlabClient:{path}>'.format(path=self.path)
+
+        return r
+
+
+
+
+class ClientWorkspace(object):
+    def __init__(self, client):
+        object.__setattr__(self, '_client', client)
+
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+
+        out = self._client._request({'op': 'lookup', 'name': attr})
+
+        if out['function']:
+            return ClientFunction(self._client, attr)
+        else:
+            return out['value']
+
+
+    def __setattr__(self, name, value):
+        self._client.put(name, value)
+
+
+
+
+class ClientFunction(object):
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+
+    def __call__(self, *args, **kwargs):
+        nout = kwargs.get('nout', 1)
+
+        return self._client._request(
+            {'op': 'call', 'name': self.name, 'nout': nout},
+            list(args)
+        )
+
+
+
+
+def send_message(sock, header, value=None):
+    """Send `header` (dict) with `value` encoded as JSON and raw array
+    buffers.
+
+    """
+    buffers = []
+    header = dict(header)
+    header['value'] = encode_value(value, buffers)
+    header['buffers'] = [b.nbytes for b in buffers]
+
+    data = json.dumps(header).encode('utf-8')
+
+    sock.sendall(length_struct.pack(len(data)) + data)
+    for b in buffers:
+        if b.nbytes > 0:
+            sock.sendall(b)
+
+
+
+def recv_message(sock):
+    """Receive a message sent by `send_message()`.  Raise EOFError if
+    the connection was closed.
+
+    Returns
+    -------
+    header : dict
+    buffers : list of bytearray
+
+    """
+    size, = length_struct.unpack(recv_exactly(sock, length_struct.size))
+    header = json.loads(recv_exactly(sock, size).decode('utf-8'))
+
+    buffers = [recv_exactly(sock, n) for n in header['buffers']]
+
+    return header, buffers
+
+
+
+def recv_exactly(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+
+    pos = 0
+    while pos < n:
+        received = sock.recv_into(view[pos:], n - pos)
+        if received == 0:
+            raise EOFError("Connection closed.")
+        pos += received
+
+    return buf
+
+
+
+def encode_value(value, buffers):
+    """Encode `value` as JSON compatible object.  Data of numeric arrays
+    is appended to `buffers` and replaced by a reference.
+
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.names is not None:
+            return {
+                '__struct__': list(value.shape),
+                'fields': [
+                    [name, [encode_value(v, buffers) for v in value[name].ravel()]]
+                    for name in value.dtype.names
+                ],
+            }
+
+        elif value.dtype.hasobject:
+            return {
+                '__cell__': list(value.shape),
+                'items': [encode_value(v, buffers) for v in value.ravel()],
+            }
+
+        elif value.dtype.kind in 'biufc':
+            ### MATLAB uses Fortran order, keep it if possible
+            if value.flags.f_contiguous:
+                order = 'F'
+                data = value.ravel(order='F')
+            else:
+                order = 'C'
+                data = np.ascontiguousarray(value).ravel()
+
+            buffers.append(data)
+
+            return {
+                '__array__': len(buffers) - 1,
+                'dtype': value.dtype.str,
+                'shape': list(value.shape),
+                'order': order,
+            }
+
+        else:
+            return encode_value(value.tolist(), buffers)
+
+    elif isinstance(value, np.generic):
+        return encode_value(value.item(), buffers)
+
+    elif isinstance(value, complex):
+        return {'__complex__': [value.real, value.imag]}
+
+    elif isinstance(value, dict):
+        return {'__dict__': [[k, encode_value(v, buffers)] for k,v in value.items()]}
+
+    elif isinstance(value, tuple):
+        return {'__tuple__': [encode_value(v, buffers) for v in value]}
+
+    elif isinstance(value, list):
+        return [encode_value(v, buffers) for v in value]
+
+    elif isinstance(value, bytes) and not isinstance(value, str):
+        return value.decode('utf-8')
+
+    else:
+        return value
+
+
+
+def decode_value(value, buffers):
+    """Inverse of `encode_value()`."""
+    if isinstance(value, list):
+        return [decode_value(v, buffers) for v in value]
+
+    elif isinstance(value, dict):
+        if '__array__' in value:
+            arr = np.frombuffer(buffers[value['__array__']], dtype=value['dtype'])
+            return arr.reshape(value['shape'], order=value['order'])
+
+        elif '__cell__' in value:
+            items = [decode_value(v, buffers) for v in value['items']]
+            out = np.empty(len(items), dtype='O')
+            for i,item in enumerate(items):
+                out[i] = item
+            return out.reshape(value['__cell__'])
+
+        elif '__struct__' in value:
+            names = [str(name) for name,_ in value['fields']]
+            arrays = []
+            for _,items in value['fields']:
+                items = [decode_value(item, buffers) for item in items]
+
+                ### Same dtypes as from `mxarray_to_ndarray()`
+                if any(isinstance(item, np.ndarray) for item in items):
+                    arr = np.empty(len(items), dtype='O')
+                    for i,item in enumerate(items):
+                        arr[i] = item
+                else:
+                    arr = np.array(items)
+
+                arrays.append(arr)
+            return np.rec.fromarrays(arrays, names=names).reshape(value['__struct__'])
+
+        elif '__complex__' in value:
+            return complex(*value['__complex__'])
+
+        elif '__dict__' in value:
+            return {str(k): decode_value(v, buffers) for k,v in value['__dict__']}
+
+        elif '__tuple__' in value:
+            return tuple(decode_value(v, buffers) for v in value['__tuple__'])
+
+        else:
+            return {str(k): decode_value(v, buffers) for k,v in value.items()}
+
+    elif (not isinstance(value, str)) and isinstance(value, type(u'')):
+        ### Python 2: JSON strings are unicode
+        return str(value)
+
+    else:
+        return value
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve MATLAB sessions on a Unix socket."
+    )
+    parser.add_argument('--socket', required=True, help="Path of the Unix socket")
+    parser.add_argument('--size', type=int, default=1, help="Number of MATLAB sessions")
+    parser.add_argument('--matlab-root', default=None, help="Root of MATLAB installation")
+    parser.add_argument('--options', default='-nosplash -nojvm', help="MATLAB start options")
+
+    args = parser.parse_args()
+
+    server = MatlabServer(
+        args.socket,
+        size=args.size,
+        matlab_root=args.matlab_root,
+        options=args.options,
+    )
+
+    print("Serving {} MATLAB session(s) on {}".format(args.size, args.socket))
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function, division, absolute_import
+
+import threading
+import contextlib
+import weakref
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from matlab_wrapper.matlab_session import MatlabSession, MatlabFunction
+
+
+class MatlabSessionPool(object):
+    """Pool of MATLAB sessions running in parallel.
+
+    Each session is used by one thread at a time.  MATLAB engine
+    calls release the GIL, therefore, sessions can compute
+    concurrently in separate threads::
+
+      pool = MatlabSessionPool(4, options='-nojvm')
+
+      with pool.session() as matlab:
+          matlab.eval('a = 1')
+
+      ys = pool.map('sin', [1., 2., 3.])
+
+    Parameters
+    ----------
+    size : int
+        Number of MATLAB sessions (engines).
+    **kwargs
+        Passed to `MatlabSession`.
+
+    Methods
+    -------
+    session()
+    map()
+    health_check()
+    close()
+
+    """
+    def __init__(self, size, **kwargs):
+
+        if size < 1:
+            raise ValueError("Pool size must be positive: {}".format(size))
+
+        self.size = size
+        self._kwargs = kwargs
+        self._idle = queue.Queue()
+        self._closed = False
+
+        ### All sessions (idle and checked out), closed by close()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+
+        ### Start all engines in parallel
+        sessions = [None] * size
+        errors = []
+
+        def start(i):
+            try:
+                sessions[i] = MatlabSession(**kwargs)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start, args=(i,)) for i in range(size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+
+        self._sessions = sessions
+
+        for session in sessions:
+            self._idle.put(session)
+
+
+
+    @contextlib.contextmanager
+    def session(self):
+        """Check out a session from the pool (context manager).
+
+        Blocks until a session is available.  If the block raises an
+        exception and the MATLAB engine is not responding anymore,
+        then the session is replaced by a new one.  Raises
+        RuntimeError after `close()`.
+
+        """
+        self._check_closed()
+
+        session = self._idle.get()
+
+        ### close() wakes up the waiting threads
+        if self._closed:
+            self._idle.put(session)
+            self._check_closed()
+
+        try:
+            yield session
+
+        except Exception:
+            if (not self._closed) and (not is_alive(session)):
+                session = self._replace(session)
+            raise
+
+        finally:
+            self._idle.put(session)
+
+
+
+    def _check_closed(self):
+        if self._closed:
+            raise RuntimeError("MatlabSessionPool was closed.")
+
+
+
+    def _replace(self, session):
+        """Start a new session in place of (dead) `session`."""
+        new = MatlabSession(**self._kwargs)
+
+        with self._sessions_lock:
+            self._sessions[self._sessions.index(session)] = new
+
+        return new
+
+
+
+    def health_check(self):
+        """Check all idle sessions and replace dead ones.
+
+        Returns
+        -------
+        int
+            Number of replaced sessions.
+
+        """
+        self._check_closed()
+
+        replaced = 0
+
+        checked = []
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if not is_alive(session):
+                session = self._replace(session)
+                replaced += 1
+
+            checked.append(session)
+
+        for session in checked:
+            self._idle.put(session)
+
+        return replaced
+
+
+
+    def map(self, func_name, iterable, nout=1):
+        """Call MATLAB function `func_name` for each element of
+        `iterable` using all sessions in parallel.
+
+        Parameters
+        ----------
+        func_name : str
+            Name of MATLAB function.
+        iterable : iterable
+            Arguments of the function.  Tuples are passed as multiple
+            arguments, anything else as a single argument.
+        nout : int, optional
+            Number of output arguments.
+
+        Returns
+        -------
+        list
+            Results in the same order as `iterable`.
+
+        """
+        self._check_closed()
+
+        tasks = queue.Queue()
+        count = 0
+        for i,args in enumerate(iterable):
+            if not isinstance(args, tuple):
+                args = (args,)
+            tasks.put((i, args))
+            count += 1
+
+        results = [None] * count
+        errors = []
+
+        def worker():
+            ### Errors must pass through session() to replace dead
+            ### engines
+            try:
+                with self.session() as session:
+                    func = MatlabFunction(func_name, weakref.ref(session))
+
+                    while not errors:
+                        try:
+                            i, args = tasks.get_nowait()
+                        except queue.Empty:
+                            break
+
+                        results[i] = func(*args, nout=nout)
+
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.size, count))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+
+        return results
+
+
+
+    def close(self):
+        """Close all sessions (including the checked out ones).  The
+        pool cannot be used afterwards.
+
+        """
+        self._closed = True
+
+        with self._sessions_lock:
+            sessions = list(self._sessions)
+
+        for session in sessions:
+            session.close()
+
+        ### Wake up threads waiting in session()
+        self._idle.put(None)
+
+
+
+    def __repr__(self):
+        r = '<MatlabSessionPool:{size}>'.format(size=self.size)
+
+        return r
+
+
+
+def is_alive(session):
+    """Check whether MATLAB engine of `session` is still running."""
+    try:
+        session.eval('1;', check=False)
+    except RuntimeError:
+        return False
+
+    return True
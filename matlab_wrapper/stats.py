@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function, division, absolute_import
+
+import time
+import math
+import threading
+import collections
+
+import numpy as np
+
+
+### High resolution timer (time.perf_counter is not available in
+### Python 2)
+timer = getattr(time, 'perf_counter', time.time)
+
+
+### Passed to the hooks after each recorded operation
+Event = collections.namedtuple(
+    'Event',
+    ['op', 'name', 'transport', 'conversion', 'nbytes', 'error']
+)
+
+
+class SessionStats(object):
+    """Counters, latency histograms and transferred bytes of
+    MatlabSession operations.
+
+    Each operation (`eval`, `get`, `put`, `call`, `lookup`, ...) is
+    recorded with its transport time (spent in the MATLAB engine)
+    and conversion time (spent converting between MATLAB and numpy
+    types).  Latency histograms have power of two buckets in
+    microseconds.
+
+    Hooks are called with an `Event` after each recorded operation.
+
+    """
+    def __init__(self):
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._ops = {}
+
+
+    def record(self, op, name=None, transport=0., conversion=0., nbytes=0, error=False):
+        """Record a single operation."""
+        total = transport + conversion
+
+        if total > 1e-6:
+            bucket = 2**int(math.ceil(math.log(total*1e6, 2)))
+        else:
+            bucket = 1
+
+        with self._lock:
+            if op not in self._ops:
+                self._ops[op] = {
+                    'count': 0,
+                    'errors': 0,
+                    'transport_time': 0.,
+                    'conversion_time': 0.,
+                    'bytes': 0,
+                    'histogram_us': {},
+                }
+
+            s = self._ops[op]
+            s['count'] += 1
+            s['errors'] += int(error)
+            s['transport_time'] += transport
+            s['conversion_time'] += conversion
+            s['bytes'] += nbytes
+            s['histogram_us'][bucket] = s['histogram_us'].get(bucket, 0) + 1
+
+        if self.hooks:
+            event = Event(op, name, transport, conversion, nbytes, error)
+            for hook in list(self.hooks):
+                hook(event)
+
+
+    def snapshot(self, reset=False):
+        """Return a copy of all statistics as a dict indexed by
+        operation names.
+
+        """
+        with self._lock:
+            snapshot = {}
+            for op,s in self._ops.items():
+                s = dict(s)
+                s['histogram_us'] = dict(s['histogram_us'])
+                snapshot[op] = s
+
+            if reset:
+                self._ops.clear()
+
+        return snapshot
+
+
+
+class ByteCounter(object):
+    """Number of data bytes (`nbytes`) counted during a conversion
+    between MATLAB and numpy.
+
+    """
+    __slots__ = ('nbytes',)
+
+    def __init__(self):
+        self.nbytes = 0
+
+
+
+def payload_size(obj):
+    """Estimate the number of data bytes in `obj` (recursively for
+    cell and struct arrays).
+
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            size = sum(payload_size(el) for el in obj.flat)
+        else:
+            size = obj.nbytes
+
+    elif isinstance(obj, np.void) and obj.dtype.names:
+        size = sum(payload_size(obj[name]) for name in obj.dtype.names)
+
+    elif isinstance(obj, (bytes, type(u''))):
+        size = len(obj)
+
+    elif isinstance(obj, (list, tuple)):
+        size = sum(payload_size(el) for el in obj)
+
+    elif obj is None:
+        size = 0
+
+    elif hasattr(obj, 'memory_usage'):
+        ### pandas objects, np.asarray() would copy the whole frame
+        size = int(np.sum(obj.memory_usage(index=False)))
+
+    else:
+        size = np.asarray(obj).nbytes
+
+    return size
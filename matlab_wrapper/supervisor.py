@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function, division, absolute_import
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from matlab_wrapper.matlab_session import MatlabSession, MatlabFunction, TimeoutError
+from matlab_wrapper.session_pool import is_alive
+from matlab_wrapper.stats import SessionStats, timer
+
+
+class SupervisedSession(object):
+    """MATLAB session that is restarted when the engine gets old,
+    large or dies.
+
+    Long running MATLAB engines grow in memory and slow down.  The
+    supervisor counts calls, watches the MATLAB process and
+    transparently replaces the engine when one of the limits is
+    exceeded::
+
+      matlab = SupervisedSession(
+          max_calls=10000,
+          max_rss=4*1024**3,
+          init_script="addpath('~/mfiles')",
+      )
+
+      matlab.put('x', 2.)
+      matlab.eval('y = x^2')
+      y = matlab.get('y')
+
+    Note that variables in MATLAB workspace are lost on restart.
+    Only `init_script` is replayed.
+
+    Parameters
+    ----------
+    max_calls : int or None, optional
+        Restart after that many operations.
+    max_age : float or None, optional
+        Restart when the engine is older than `max_age` seconds.
+    max_rss : int or None, optional
+        Restart when the resident memory of the MATLAB process
+        exceeds `max_rss` bytes.  Requires psutil.
+    max_cpu_time : float or None, optional
+        Restart when the MATLAB process used more than `max_cpu_time`
+        seconds of CPU time.  Requires psutil.
+    check_interval : float, optional
+        Minimal time in seconds between two checks of the MATLAB
+        process (memory and CPU time).
+    init_script : str or None, optional
+        MATLAB code evaluated in each new engine, e.g. `addpath()`.
+    **kwargs
+        Passed to `MatlabSession`.
+
+    Methods
+    -------
+    eval(expression, check=True, timeout=None)
+    get(name, copy=True)
+    put(name, value)
+    get_many(names)
+    put_many(mapping)
+    restart(reason='manual')
+    process_info()
+    stats(reset=False)
+    add_stats_hook(hook)
+    remove_stats_hook(hook)
+
+    """
+    def __init__(
+            self,
+            max_calls=None,
+            max_age=None,
+            max_rss=None,
+            max_cpu_time=None,
+            check_interval=1.,
+            init_script=None,
+            **kwargs
+    ):
+
+        if (psutil is None) and ((max_rss is not None) or (max_cpu_time is not None)):
+            raise ImportError("psutil is required for max_rss and max_cpu_time.")
+
+        self.max_calls = max_calls
+        self.max_age = max_age
+        self.max_rss = max_rss
+        self.max_cpu_time = max_cpu_time
+        self.check_interval = check_interval
+        self.init_script = init_script
+        self._kwargs = kwargs
+
+        ### Statistics of all engines including restarts
+        self._stats = SessionStats()
+
+        self.workspace = SupervisedWorkspace(self)
+
+        self._start()
+
+
+
+    def _start(self):
+        session = MatlabSession(**self._kwargs)
+
+        if self.init_script is not None:
+            session.eval(self.init_script)
+
+        ### Forward all events to the supervisor statistics; the hook
+        ### must not reference `self` to avoid reference cycles
+        stats = self._stats
+        session.add_stats_hook(lambda event: stats.record(*event))
+
+        self._session = session
+        self._started = timer()
+        self._calls = 0
+        self._last_check = self._started
+
+        if psutil is not None and (session.pid is not None):
+            self._process = psutil.Process(session.pid)
+        else:
+            self._process = None
+
+
+
+    @property
+    def session(self):
+        """Currently supervised `MatlabSession`."""
+        return self._session
+
+
+
+    def restart(self, reason='manual'):
+        """Replace the MATLAB engine with a new one.
+
+        The restart is recorded in statistics as a `restart`
+        operation with `reason` as the name.
+
+        """
+        t0 = timer()
+
+        ### Dropping the last reference closes the engine
+        self._session = None
+        self._process = None
+
+        self._start()
+
+        self._stats.record('restart', name=reason, transport=timer()-t0)
+
+
+
+    def process_info(self):
+        """Return dict with `pid`, `calls`, `age` and, if psutil is
+        available, `rss` (bytes) and `cpu_time` (seconds) of the
+        MATLAB process.
+
+        """
+        info = {
+            'pid': self._session.pid,
+            'calls': self._calls,
+            'age': timer() - self._started,
+        }
+
+        if self._process is not None:
+            try:
+                info['rss'] = self._process.memory_info().rss
+                cpu = self._process.cpu_times()
+                info['cpu_time'] = cpu.user + cpu.system
+            except psutil.Error:
+                pass
+
+        return info
+
+
+
+    def _restart_reason(self):
+        if (self.max_calls is not None) and (self._calls >= self.max_calls):
+            return 'calls'
+
+        now = timer()
+
+        if (self.max_age is not None) and (now - self._started >= self.max_age):
+            return 'age'
+
+        if (self._process is None) or (now - self._last_check < self.check_interval):
+            return None
+
+        self._last_check = now
+
+        try:
+            if self.max_rss is not None:
+                if self._process.memory_info().rss >= self.max_rss:
+                    return 'rss'
+
+            if self.max_cpu_time is not None:
+                cpu = self._process.cpu_times()
+                if cpu.user + cpu.system >= self.max_cpu_time:
+                    return 'cpu_time'
+
+        except psutil.NoSuchProcess:
+            return 'dead'
+
+        return None
+
+
+
+    def _run(self, func, count=True):
+        """Call `func(session)` restarting the engine before, if
+        necessary, and after, if MATLAB died.  The call is counted
+        towards `max_calls` if `count` is True.
+
+        """
+        reason = self._restart_reason()
+        if reason is not None:
+            self.restart(reason)
+
+        if count:
+            self._calls += 1
+
+        session = self._session
+        try:
+            return func(session)
+        except TimeoutError:
+            self.restart('timeout')
+            raise
+        except RuntimeError:
+            if not is_alive(session):
+                self.restart('dead')
+            raise
+
+
+
+    def eval(self, expression, check=True, timeout=None):
+        """See `MatlabSession.eval()`."""
+        return self._run(lambda s: s.eval(expression, check=check, timeout=timeout))
+
+
+    def get(self, name, copy=True):
+        """See `MatlabSession.get()`."""
+        return self._run(lambda s: s.get(name, copy=copy))
+
+
+    def put(self, name, value):
+        """See `MatlabSession.put()`."""
+        return self._run(lambda s: s.put(name, value))
+
+
+    def get_many(self, names):
+        """See `MatlabSession.get_many()`."""
+        return self._run(lambda s: s.get_many(names))
+
+
+    def put_many(self, mapping):
+        """See `MatlabSession.put_many()`."""
+        return self._run(lambda s: s.put_many(mapping))
+
+
+
+    def stats(self, reset=False):
+        """Return statistics of all engines, see
+        `MatlabSession.stats()`.  Restarts are recorded as `restart`
+        operations named after the reason (`calls`, `age`, `rss`,
+        `cpu_time`, `dead`, `timeout` or `manual`).
+
+        """
+        return self._stats.snapshot(reset=reset)
+
+
+    def add_stats_hook(self, hook):
+        """See `MatlabSession.add_stats_hook()`."""
+        self._stats.hooks.append(hook)
+
+
+    def remove_stats_hook(self, hook):
+        """See `MatlabSession.remove_stats_hook()`."""
+        self._stats.hooks.remove(hook)
+
+
+
+    def __repr__(self):
+        r = '<SupervisedSession:{session}>'.format(session=self._session)
+
+        return r
+
+
+
+
+class SupervisedWorkspace(object):
+    def __init__(self, supervisor):
+        object.__setattr__(self, '_supervisor', supervisor)
+
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+
+        ### Function lookups are not counted, only the calls
+        out = self._supervisor._run(lambda s: getattr(s.workspace, attr), count=False)
+
+        ### Functions are bound to a single engine, resolve them
+        ### again on each call
+        if isinstance(out, MatlabFunction):
+            out = SupervisedFunction(self._supervisor, attr)
+        else:
+            self._supervisor._calls += 1
+
+        return out
+
+
+    def __setattr__(self, name, value):
+        self._supervisor.put(name, value)
+
+
+
+
+class SupervisedFunction(object):
+    def __init__(self, supervisor, name):
+        self._supervisor = supervisor
+        self.name = name
+
+
+    def __call__(self, *args, **kwargs):
+        name = self.name
+        return self._supervisor._run(
+            lambda s: getattr(s.workspace, name)(*args, **kwargs)
+        )
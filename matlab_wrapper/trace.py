@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014-2015 Marek Rudnicki
+#
+# This file is part of matlab_wrapper.
+#
+# matlab_wrapper is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# matlab_wrapper is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import json
+import threading
+
+from matlab_wrapper.stats import timer
+
+
+class Tracer(object):
+    """Record timeline of engine calls and conversions.
+
+    The events are stored in the Chrome trace-event format, which can
+    be viewed in chrome://tracing or https://ui.perfetto.dev::
+
+      tracer = Tracer()
+      matlab = MatlabSession(tracer=tracer)
+
+      matlab.workspace.sin([1., 2., 3.])
+
+      tracer.save('trace.json')
+
+    Spans are recorded for every `engEvalString`, `engGetVariable`
+    and `engPutVariable` call and for each (nested) conversion step.
+
+    """
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._t0 = timer()
+
+
+    def span(self, span_name, category, **args):
+        """Return context manager recording a span (complete event)
+        named `span_name` in `category` with `args` (e.g. `name` of a
+        variable).
+
+        """
+        return Span(self, span_name, category, args)
+
+
+    def _add(self, name, cat, start, end, args):
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start - self._t0) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self._pid,
+            'tid': threading.current_thread().ident,
+            'args': args,
+        }
+
+        with self._lock:
+            self._events.append(event)
+
+
+    def events(self):
+        """Return a list of all recorded events."""
+        with self._lock:
+            return list(self._events)
+
+
+    def clear(self):
+        """Forget all recorded events."""
+        with self._lock:
+            self._events = []
+
+
+    def to_json(self):
+        return json.dumps({'traceEvents': self.events()}, default=str)
+
+
+    def save(self, filename):
+        """Write the trace to `filename` (JSON)."""
+        with open(filename, 'w') as f:
+            f.write(self.to_json())
+
+
+
+class Span(object):
+    def __init__(self, tracer, name, cat, args):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+
+    def set(self, **args):
+        """Add arguments to the span."""
+        self._args.update(args)
+
+    def __enter__(self):
+        self._start = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._args['error'] = str(exc_value)
+
+        self._tracer._add(self._name, self._cat, self._start, timer(), self._args)
+
+
+
+class NullTracer(object):
+    """Tracer that does not record anything (default)."""
+    def span(self, span_name, category, **args):
+        return null_span
+
+    def events(self):
+        return []
+
+
+
+class NullSpan(object):
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+
+null_tracer = NullTracer()
+null_span = NullSpan()
@@ -31,8 +31,14 @@ setup(
         "Programming Language :: Python",
         "Programming Language :: Python :: 2",
         "Programming Language :: Python :: 2.7",
+        "Programming Language :: Python :: 3",
     ],
 
     platforms=["Linux", "Windows", "OSX"],
+    python_requires=">=2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*",
     install_requires=["numpy"],
+    extras_require={
+        "bulk": ["scipy"],
+        "supervisor": ["psutil"],
+    },
 )
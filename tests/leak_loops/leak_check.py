@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Check for memory leaks: run typical operations for a fixed number
+of iterations and make sure that the memory (RSS) of the Python
+process does not grow more than a threshold.
+
+Exits with non-zero status if any of the checks fails.
+
+"""
+
+from __future__ import division, absolute_import, print_function
+
+import sys
+import argparse
+
+import numpy as np
+
+import matlab_wrapper
+import psutil
+
+
+def rss():
+    return psutil.Process().memory_info().rss
+
+
+def check(name, func, iterations, threshold, warmup=5):
+    """Run `func(i)` and return RSS growth (in bytes) after warm-up."""
+    for i in range(warmup):
+        func(i)
+
+    before = rss()
+
+    for i in range(iterations):
+        func(i)
+
+    growth = rss() - before
+
+    status = 'OK' if growth < threshold else 'FAIL'
+    print("{:<20} {:>10.2f} MB  {}".format(name, growth/1e6, status))
+
+    return growth < threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--threshold-mb', type=float, default=10.)
+    parser.add_argument('--matlab-root', default=None)
+    args = parser.parse_args()
+
+    threshold = args.threshold_mb * 1e6
+
+    kwargs = {'options': '-nojvm', 'matlab_root': args.matlab_root}
+    matlab = matlab_wrapper.MatlabSession(**kwargs)
+
+
+    a = np.random.randn(100000)
+
+    c = np.array([1., 'text', np.eye(20)], dtype='O')
+    c = np.array([c, c, 'abc'], dtype='O')
+
+    s = np.rec.fromrecords([
+        (1, 'a', np.eye(3)),
+        (2, 'bb', np.eye(4)),
+    ])
+
+
+    def put_get(i):
+        matlab.put('a', a)
+        matlab.get('a')
+
+    def put_get_nocopy(i):
+        matlab.put('a', a)
+        matlab.get('a', copy=False)
+
+    def eval_error(i):
+        try:
+            matlab.eval("a = onesBLA(10)")
+        except RuntimeError:
+            pass
+
+    def cell_struct(i):
+        matlab.put('c', c)
+        matlab.get('c')
+        matlab.put('s', s)
+        matlab.get('s')
+
+    def put_get_many(i):
+        matlab.put_many({'a': a, 'c': c})
+        matlab.get_many(['a', 'c'])
+
+    def restart(i):
+        matlab_wrapper.MatlabSession(**kwargs)
+
+
+    results = [
+        check('put/get', put_get, args.iterations, threshold),
+        check('put/get (no copy)', put_get_nocopy, args.iterations, threshold),
+        check('eval with error', eval_error, args.iterations, threshold),
+        check('cell/struct', cell_struct, args.iterations, threshold),
+        check('put_many/get_many', put_get_many, args.iterations, threshold),
+        check('restart', restart, max(args.iterations // 100, 5), threshold, warmup=1),
+    ]
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
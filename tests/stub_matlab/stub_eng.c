@@ -0,0 +1,308 @@
+/*
+ * Stand-in for MATLAB's libeng (matlab_wrapper testing and benchmarking).
+ *
+ * Copyright 2014-2015 Marek Rudnicki
+ *
+ * This file is part of matlab_wrapper.
+ *
+ * matlab_wrapper is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * matlab_wrapper is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * The engine keeps an in-memory workspace.  engEvalString()
+ * understands only the statements used by matlab_wrapper to move
+ * variables around:
+ *
+ *   clear [name ...]
+ *   x = y
+ *   x = y.f
+ *   x = struct()
+ *   x.f = y
+ *
+ * All other statements are silently ignored (no output, no errors).
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include <ctype.h>
+
+#include "stub_mx.h"
+
+
+const char *libeng_version = "8.5";
+
+
+typedef struct Variable {
+    char *name;
+    mxArray *value;
+    struct Variable *next;
+} Variable;
+
+typedef struct Engine {
+    Variable *variables;
+    char *buffer;
+    int buffer_len;
+} Engine;
+
+
+static Variable **find_variable(Engine *ep, const char *name)
+{
+    Variable **v;
+
+    for (v = &ep->variables; *v != NULL; v = &(*v)->next)
+        if (strcmp((*v)->name, name) == 0)
+            break;
+
+    return v;
+}
+
+
+/* Store `value` as variable `name` (takes ownership of `value`) */
+static void set_variable(Engine *ep, const char *name, mxArray *value)
+{
+    Variable **v;
+
+    v = find_variable(ep, name);
+
+    if (*v == NULL) {
+        *v = calloc(1, sizeof(Variable));
+        (*v)->name = strdup(name);
+    } else {
+        mxDestroyArray((*v)->value);
+    }
+
+    (*v)->value = value;
+}
+
+
+static mxArray *get_variable(Engine *ep, const char *name)
+{
+    Variable *v;
+
+    v = *find_variable(ep, name);
+
+    return (v == NULL) ? NULL : v->value;
+}
+
+
+static void clear_variable(Engine *ep, const char *name)
+{
+    Variable **v, *next;
+
+    v = find_variable(ep, name);
+
+    if (*v != NULL) {
+        next = (*v)->next;
+        mxDestroyArray((*v)->value);
+        free((*v)->name);
+        free(*v);
+        *v = next;
+    }
+}
+
+
+static void clear_all(Engine *ep)
+{
+    while (ep->variables != NULL)
+        clear_variable(ep, ep->variables->name);
+}
+
+
+Engine *engOpen(const char *command)
+{
+    (void)command;
+
+    return calloc(1, sizeof(Engine));
+}
+
+
+int engClose(Engine *ep)
+{
+    if (ep == NULL)
+        return 1;
+
+    clear_all(ep);
+    free(ep);
+
+    return 0;
+}
+
+
+int engOutputBuffer(Engine *ep, char *buffer, int buflen)
+{
+    ep->buffer = buffer;
+    ep->buffer_len = buflen;
+
+    if (buffer != NULL && buflen > 0)
+        buffer[0] = '\0';
+
+    return 0;
+}
+
+
+int engPutVariable(Engine *ep, const char *name, const mxArray *pm)
+{
+    if (ep == NULL || pm == NULL)
+        return 1;
+
+    set_variable(ep, name, mxDuplicateArray(pm));
+
+    return 0;
+}
+
+
+mxArray *engGetVariable(Engine *ep, const char *name)
+{
+    mxArray *pm;
+
+    pm = get_variable(ep, name);
+
+    return (pm == NULL) ? NULL : mxDuplicateArray(pm);
+}
+
+
+/* Parse `name` or `name.field` at `*s`.  Return 0 on failure. */
+static int parse_reference(const char **s, char *name, char *field, size_t len)
+{
+    size_t n;
+
+    while (isspace((unsigned char)**s))
+        (*s)++;
+
+    for (n = 0; (isalnum((unsigned char)**s) || **s == '_') && n < len - 1; n++)
+        name[n] = *(*s)++;
+    name[n] = '\0';
+
+    field[0] = '\0';
+    if (**s == '.') {
+        (*s)++;
+        for (n = 0; (isalnum((unsigned char)**s) || **s == '_') && n < len - 1; n++)
+            field[n] = *(*s)++;
+        field[n] = '\0';
+        if (n == 0)
+            return 0;
+    }
+
+    while (isspace((unsigned char)**s))
+        (*s)++;
+
+    return name[0] != '\0' && !isdigit((unsigned char)name[0]);
+}
+
+
+static void eval_statement(Engine *ep, const char *stmt)
+{
+    char lhs[64], lhs_field[64], rhs[64], rhs_field[64], name[64];
+    const char *s = stmt;
+    mxArray *value, *lhs_value;
+    mwSize dims[2] = {1, 1};
+    size_t n;
+    int i;
+
+    while (isspace((unsigned char)*s))
+        s++;
+
+    /* clear [name ...] */
+    if (strncmp(s, "clear", 5) == 0 && (s[5] == '\0' || isspace((unsigned char)s[5]))) {
+        s += 5;
+        if (*s == '\0') {
+            clear_all(ep);
+            return;
+        }
+        while (*s != '\0') {
+            while (isspace((unsigned char)*s))
+                s++;
+            for (n = 0; *s != '\0' && !isspace((unsigned char)*s) && n < sizeof(name) - 1; n++)
+                name[n] = *s++;
+            name[n] = '\0';
+            if (strcmp(name, "all") == 0)
+                clear_all(ep);
+            else if (n > 0)
+                clear_variable(ep, name);
+        }
+        return;
+    }
+
+    /* lhs = rhs */
+    if (!parse_reference(&s, lhs, lhs_field, sizeof(lhs)) || *s != '=' || s[1] == '=')
+        return;
+    s++;
+
+    while (isspace((unsigned char)*s))
+        s++;
+
+    if (strncmp(s, "struct()", 8) == 0) {
+        value = mxCreateStructArray(2, dims, 0, NULL);
+        s += 8;
+    } else {
+        if (!parse_reference(&s, rhs, rhs_field, sizeof(rhs)))
+            return;
+
+        value = get_variable(ep, rhs);
+        if (value != NULL && rhs_field[0] != '\0')
+            value = (value->numel > 0) ? mxGetField(value, 0, rhs_field) : NULL;
+        if (value == NULL)
+            return;
+
+        value = mxDuplicateArray(value);
+    }
+
+    while (isspace((unsigned char)*s))
+        s++;
+    if (*s != '\0') {
+        mxDestroyArray(value);
+        return;
+    }
+
+    if (lhs_field[0] == '\0') {
+        set_variable(ep, lhs, value);
+        return;
+    }
+
+    lhs_value = get_variable(ep, lhs);
+    if (lhs_value == NULL || lhs_value->classid != mxSTRUCT_CLASS || lhs_value->numel < 1) {
+        lhs_value = mxCreateStructArray(2, dims, 0, NULL);
+        set_variable(ep, lhs, lhs_value);
+    }
+
+    i = mxAddField(lhs_value, lhs_field);
+    mxDestroyArray(((mxArray **)lhs_value->data)[i]);
+    mxSetField(lhs_value, 0, lhs_field, value);
+}
+
+
+int engEvalString(Engine *ep, const char *string)
+{
+    char *copy, *stmt, *end;
+
+    if (ep == NULL)
+        return 1;
+
+    if (ep->buffer != NULL && ep->buffer_len > 0)
+        ep->buffer[0] = '\0';
+
+    copy = strdup(string);
+
+    /* Statements are separated by newlines, commas and semicolons */
+    for (stmt = copy; stmt != NULL; stmt = end) {
+        end = strpbrk(stmt, "\n;,");
+        if (end != NULL)
+            *end++ = '\0';
+        eval_statement(ep, stmt);
+    }
+
+    free(copy);
+
+    return 0;
+}
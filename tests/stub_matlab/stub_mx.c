@@ -0,0 +1,398 @@
+/*
+ * Stand-in for MATLAB's libmx (matlab_wrapper testing and benchmarking).
+ *
+ * Copyright 2014-2015 Marek Rudnicki
+ *
+ * This file is part of matlab_wrapper.
+ *
+ * matlab_wrapper is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * matlab_wrapper is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with matlab_wrapper.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdlib.h>
+#include <string.h>
+
+#include "stub_mx.h"
+
+
+static const char *class_names[] = {
+    "unknown", "cell", "struct", "logical", "char", "void",
+    "double", "single", "int8", "uint8", "int16", "uint16",
+    "int32", "uint32", "int64", "uint64",
+};
+
+static const size_t class_sizes[] = {
+    0, sizeof(mxArray *), sizeof(mxArray *), 1, 2, 0,
+    8, 4, 1, 1, 2, 2,
+    4, 4, 8, 8,
+};
+
+
+static mxArray *create_array(mwSize ndim, const mwSize *dims, int classid, int complexity, int init)
+{
+    mxArray *pm;
+    mwSize i;
+
+    if (classid < 1 || classid > mxUINT64_CLASS || classid == mxVOID_CLASS)
+        return NULL;
+
+    pm = calloc(1, sizeof(mxArray));
+    if (pm == NULL)
+        return NULL;
+
+    /* MATLAB arrays have at least 2 dimensions, trailing singleton
+     * dimensions are removed */
+    while (ndim > 2 && dims[ndim-1] == 1)
+        ndim--;
+
+    pm->ndim = ndim < 2 ? 2 : ndim;
+    pm->dims = malloc(pm->ndim * sizeof(mwSize));
+    pm->numel = 1;
+    for (i = 0; i < pm->ndim; i++) {
+        pm->dims[i] = (i < ndim) ? dims[i] : 1;
+        pm->numel *= pm->dims[i];
+    }
+
+    pm->classid = classid;
+    pm->elem_size = class_sizes[classid];
+
+    if (init || classid == mxCELL_CLASS || classid == mxSTRUCT_CLASS) {
+        pm->data = calloc(pm->numel ? pm->numel : 1, pm->elem_size);
+        if (complexity)
+            pm->imag = calloc(pm->numel ? pm->numel : 1, pm->elem_size);
+    } else {
+        pm->data = malloc(pm->numel ? pm->numel * pm->elem_size : 1);
+        if (complexity)
+            pm->imag = malloc(pm->numel ? pm->numel * pm->elem_size : 1);
+    }
+
+    return pm;
+}
+
+
+mxArray *mxCreateNumericArray(mwSize ndim, const mwSize *dims, int classid, int complexity)
+{
+    return create_array(ndim, dims, classid, complexity, 1);
+}
+
+
+mxArray *mxCreateUninitNumericArray(mwSize ndim, const mwSize *dims, int classid, int complexity)
+{
+    return create_array(ndim, dims, classid, complexity, 0);
+}
+
+
+mxArray *mxCreateLogicalArray(mwSize ndim, const mwSize *dims)
+{
+    return create_array(ndim, dims, mxLOGICAL_CLASS, 0, 1);
+}
+
+
+mxArray *mxCreateCellArray(mwSize ndim, const mwSize *dims)
+{
+    return create_array(ndim, dims, mxCELL_CLASS, 0, 1);
+}
+
+
+mxArray *mxCreateStructArray(mwSize ndim, const mwSize *dims, int nfields, const char **fieldnames)
+{
+    mxArray *pm;
+    int i;
+
+    pm = create_array(ndim, dims, mxSTRUCT_CLASS, 0, 1);
+    if (pm == NULL)
+        return NULL;
+
+    free(pm->data);
+    pm->nfields = nfields;
+    pm->data = calloc(pm->numel * nfields + 1, sizeof(mxArray *));
+    pm->fieldnames = calloc(nfields + 1, sizeof(char *));
+    for (i = 0; i < nfields; i++)
+        pm->fieldnames[i] = strdup(fieldnames[i]);
+
+    return pm;
+}
+
+
+mxArray *mxCreateString(const char *str)
+{
+    mxArray *pm;
+    mwSize dims[2];
+    size_t i, len;
+    unsigned short *chars;
+
+    len = strlen(str);
+    dims[0] = 1;
+    dims[1] = len;
+
+    pm = create_array(2, dims, mxCHAR_CLASS, 0, 1);
+    if (pm == NULL)
+        return NULL;
+
+    chars = pm->data;
+    for (i = 0; i < len; i++)
+        chars[i] = (unsigned char)str[i];
+
+    return pm;
+}
+
+
+void mxDestroyArray(mxArray *pm)
+{
+    mwSize i;
+    mxArray **elements;
+
+    if (pm == NULL)
+        return;
+
+    if (pm->classid == mxCELL_CLASS || pm->classid == mxSTRUCT_CLASS) {
+        elements = pm->data;
+        for (i = 0; i < pm->numel * (pm->classid == mxSTRUCT_CLASS ? pm->nfields : 1); i++)
+            mxDestroyArray(elements[i]);
+    }
+
+    for (i = 0; i < (mwSize)pm->nfields; i++)
+        free(pm->fieldnames[i]);
+
+    free(pm->fieldnames);
+    free(pm->dims);
+    free(pm->data);
+    free(pm->imag);
+    free(pm);
+}
+
+
+mxArray *mxDuplicateArray(const mxArray *pm)
+{
+    mxArray *dup;
+    mwSize i, n;
+    mxArray **src, **dst;
+
+    if (pm == NULL)
+        return NULL;
+
+    if (pm->classid == mxSTRUCT_CLASS) {
+        dup = mxCreateStructArray(pm->ndim, pm->dims, pm->nfields, (const char **)pm->fieldnames);
+    } else {
+        dup = create_array(pm->ndim, pm->dims, pm->classid, pm->imag != NULL, 0);
+    }
+
+    if (pm->classid == mxCELL_CLASS || pm->classid == mxSTRUCT_CLASS) {
+        n = pm->numel * (pm->classid == mxSTRUCT_CLASS ? pm->nfields : 1);
+        src = pm->data;
+        dst = dup->data;
+        for (i = 0; i < n; i++)
+            dst[i] = mxDuplicateArray(src[i]);
+    } else {
+        memcpy(dup->data, pm->data, pm->numel * pm->elem_size);
+        if (pm->imag != NULL)
+            memcpy(dup->imag, pm->imag, pm->numel * pm->elem_size);
+    }
+
+    return dup;
+}
+
+
+mwSize mxGetNumberOfDimensions(const mxArray *pm)
+{
+    return pm->ndim;
+}
+
+
+const mwSize *mxGetDimensions(const mxArray *pm)
+{
+    return pm->dims;
+}
+
+
+size_t mxGetNumberOfElements(const mxArray *pm)
+{
+    return pm->numel;
+}
+
+
+size_t mxGetElementSize(const mxArray *pm)
+{
+    return pm->elem_size;
+}
+
+
+const char *mxGetClassName(const mxArray *pm)
+{
+    return class_names[pm->classid];
+}
+
+
+bool mxIsNumeric(const mxArray *pm)
+{
+    return pm->classid >= mxDOUBLE_CLASS;
+}
+
+
+bool mxIsCell(const mxArray *pm)
+{
+    return pm->classid == mxCELL_CLASS;
+}
+
+
+bool mxIsComplex(const mxArray *pm)
+{
+    return pm->imag != NULL;
+}
+
+
+void *mxGetData(const mxArray *pm)
+{
+    return pm->data;
+}
+
+
+void *mxGetImagData(const mxArray *pm)
+{
+    return pm->imag;
+}
+
+
+mxArray *mxGetCell(const mxArray *pm, mwIndex i)
+{
+    if (pm->classid != mxCELL_CLASS || i >= pm->numel)
+        return NULL;
+
+    return ((mxArray **)pm->data)[i];
+}
+
+
+void mxSetCell(mxArray *pm, mwIndex i, mxArray *value)
+{
+    if (pm->classid != mxCELL_CLASS || i >= pm->numel)
+        return;
+
+    ((mxArray **)pm->data)[i] = value;
+}
+
+
+int mxGetNumberOfFields(const mxArray *pm)
+{
+    return pm->nfields;
+}
+
+
+const char *mxGetFieldNameByNumber(const mxArray *pm, int n)
+{
+    if (n < 0 || n >= pm->nfields)
+        return NULL;
+
+    return pm->fieldnames[n];
+}
+
+
+int mxGetFieldNumber(const mxArray *pm, const char *name)
+{
+    int n;
+
+    if (pm->classid != mxSTRUCT_CLASS)
+        return -1;
+
+    for (n = 0; n < pm->nfields; n++)
+        if (strcmp(pm->fieldnames[n], name) == 0)
+            return n;
+
+    return -1;
+}
+
+
+int mxAddField(mxArray *pm, const char *name)
+{
+    mxArray **data;
+    mwSize i;
+    int n;
+
+    n = mxGetFieldNumber(pm, name);
+    if (n >= 0 || pm->classid != mxSTRUCT_CLASS)
+        return n;
+
+    data = calloc(pm->numel * (pm->nfields + 1) + 1, sizeof(mxArray *));
+    for (i = 0; i < pm->numel; i++)
+        memcpy(data + i * (pm->nfields + 1),
+               (mxArray **)pm->data + i * pm->nfields,
+               pm->nfields * sizeof(mxArray *));
+
+    free(pm->data);
+    pm->data = data;
+
+    pm->fieldnames = realloc(pm->fieldnames, (pm->nfields + 1) * sizeof(char *));
+    pm->fieldnames[pm->nfields] = strdup(name);
+
+    return pm->nfields++;
+}
+
+
+mxArray *mxGetField(const mxArray *pm, mwIndex i, const char *name)
+{
+    int n;
+
+    n = mxGetFieldNumber(pm, name);
+    if (n < 0 || i >= pm->numel)
+        return NULL;
+
+    return ((mxArray **)pm->data)[i * pm->nfields + n];
+}
+
+
+void mxSetField(mxArray *pm, mwIndex i, const char *name, mxArray *value)
+{
+    int n;
+
+    n = mxGetFieldNumber(pm, name);
+    if (n < 0 || i >= pm->numel)
+        return;
+
+    ((mxArray **)pm->data)[i * pm->nfields + n] = value;
+}
+
+
+int mxGetString(const mxArray *pm, char *buf, mwSize buflen)
+{
+    mwSize i;
+    const unsigned short *chars;
+
+    if (pm->classid != mxCHAR_CLASS || buflen == 0)
+        return 1;
+
+    chars = pm->data;
+    for (i = 0; i < pm->numel && i < buflen - 1; i++)
+        buf[i] = (char)chars[i];
+    buf[i] = '\0';
+
+    return (pm->numel < buflen) ? 0 : 1;
+}
+
+
+char *mxArrayToString(const mxArray *pm)
+{
+    char *buf;
+
+    if (pm->classid != mxCHAR_CLASS)
+        return NULL;
+
+    buf = malloc(pm->numel + 1);
+    mxGetString(pm, buf, pm->numel + 1);
+
+    return buf;
+}
+
+
+void mxFree(void *ptr)
+{
+    free(ptr);
+}
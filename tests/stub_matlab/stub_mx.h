@@ -0,0 +1,53 @@
+/*
+ * Stand-in for MATLAB's libmx (matlab_wrapper testing and benchmarking).
+ */
+
+#ifndef STUB_MX_H
+#define STUB_MX_H
+
+#include <stddef.h>
+#include <stdbool.h>
+
+typedef size_t mwSize;
+typedef size_t mwIndex;
+
+enum {
+    mxCELL_CLASS = 1,
+    mxSTRUCT_CLASS,
+    mxLOGICAL_CLASS,
+    mxCHAR_CLASS,
+    mxVOID_CLASS,
+    mxDOUBLE_CLASS,
+    mxSINGLE_CLASS,
+    mxINT8_CLASS,
+    mxUINT8_CLASS,
+    mxINT16_CLASS,
+    mxUINT16_CLASS,
+    mxINT32_CLASS,
+    mxUINT32_CLASS,
+    mxINT64_CLASS,
+    mxUINT64_CLASS
+};
+
+typedef struct mxArray {
+    int classid;
+    mwSize ndim;
+    mwSize *dims;
+    mwSize numel;
+    size_t elem_size;
+    void *data;                 /* elements or mxArray* (cell, struct) */
+    void *imag;                 /* NULL for real arrays */
+    int nfields;
+    char **fieldnames;
+} mxArray;
+
+mxArray *mxCreateNumericArray(mwSize ndim, const mwSize *dims, int classid, int complexity);
+mxArray *mxCreateStructArray(mwSize ndim, const mwSize *dims, int nfields, const char **fieldnames);
+mxArray *mxDuplicateArray(const mxArray *pm);
+void mxDestroyArray(mxArray *pm);
+int mxGetFieldNumber(const mxArray *pm, const char *name);
+int mxAddField(mxArray *pm, const char *name);
+mxArray *mxGetField(const mxArray *pm, mwIndex i, const char *name);
+void mxSetField(mxArray *pm, mwIndex i, const char *name, mxArray *value);
+
+#endif
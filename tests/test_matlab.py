@@ -14,6 +14,8 @@ import pandas as pd
 import matlab_wrapper
 
 import pytest
+import sys
+import os
 
 
 NUMERIC_DTYPES = ('int8', 'int16', 'int32', 'int64', 'uint8',
@@ -33,6 +35,25 @@ def matlab():
 
 
 
+def test_find_matlab_root_cache(tmpdir, monkeypatch):
+    from matlab_wrapper import matlab_session
+
+    root = tmpdir.mkdir('MATLAB')
+    root.mkdir('bin').join('matlab').write('')
+    cache_file = tmpdir.join('cache.json')
+
+    monkeypatch.setenv('PATH', str(root.join('bin')))
+    monkeypatch.setenv('MATLAB_WRAPPER_CACHE', str(cache_file))
+    monkeypatch.setattr(matlab_session, 'matlab_root_cache', {})
+
+    assert_equal(matlab_session.find_matlab_root(), str(root))
+    assert cache_file.check()
+
+    monkeypatch.setattr(matlab_session, 'matlab_root_cache', {})
+    assert_equal(matlab_session.find_matlab_root(), str(root))
+
+
+
 def test_eval_ok(matlab):
     command = "a = ones(10)"
     matlab.eval(command)
@@ -46,6 +67,31 @@ def test_eval_error(matlab):
         matlab.eval(command)
 
 
+def test_eval_error_long_output(matlab):
+    command = "disp(ones(100)); a = onesBLA(10)"
+
+    with pytest.raises(RuntimeError):
+        matlab.eval(command)
+
+    matlab.eval("disp(ones(100))")
+
+
+def test_eval_error_output_buffer(matlab):
+    command = "disp('before error'); a = onesBLA(10)"
+
+    with pytest.raises(RuntimeError):
+        matlab.eval(command)
+
+    assert 'before error' in matlab.output_buffer
+
+
+def test_eval_nocheck(matlab):
+    matlab.eval("a = onesBLA(10)", check=False)
+    matlab.eval("a = 1", check=False)
+
+    assert_equal(matlab.get('a'), 1)
+
+
 def test_clear(matlab):
     command = "clear all"
     matlab.eval(command)
@@ -80,6 +126,23 @@ def test_get_logical(matlab):
     assert_equal(a, b)
 
 
+def test_get_nocopy(matlab):
+    for dtype in NUMERIC_DTYPES:
+
+        a = np.eye(4,5, dtype=dtype)
+        matlab.eval("b = eye(4,5, '{}')".format(dtype))
+        b = matlab.get('b', copy=False)
+
+        assert_equal(a.dtype, b.dtype)
+        assert_equal(a, b)
+        assert b.flags.f_contiguous
+
+    matlab.eval("b = eye(4,5) > 0")
+    b = matlab.get('b', copy=False)
+
+    assert_equal(np.eye(4,5, dtype='bool'), b)
+
+
 def test_get_comples(matlab):
     for dtype in ('single', 'double'):
         a = np.eye(4,5, dtype=dtype) + np.eye(4,5, dtype=dtype)*1j
@@ -221,6 +284,17 @@ def test_put_get_numeric(matlab):
 
 
 
+def test_put_get_strided(matlab):
+    a = np.random.randn(6,8,4)
+
+    for arr in (a, a[::2,1::3], np.asfortranarray(a), a.transpose(1,0,2)):
+        matlab.put('a', arr)
+        aa = matlab.get('a')
+
+        assert_equal(arr, aa)
+
+
+
 def test_put_get_logical(matlab):
     a = np.random.randn(3,2,4)>0
 
@@ -254,6 +328,42 @@ def test_put_get_string(matlab):
 
 
 
+def test_put_get_many(matlab):
+    values = {
+        'a': np.random.randn(3,2),
+        'b': np.array([1,2,3], dtype='int8'),
+        's': "asdf",
+        'c': np.array([1., 'x'], dtype='O'),
+    }
+
+    matlab.put_many(values)
+    actual = matlab.get_many(['a', 'b', 's'])
+
+    assert_equal(sorted(actual.keys()), ['a', 'b', 's'])
+    assert_equal(actual['a'], values['a'])
+    assert_equal(actual['b'], values['b'])
+    assert_equal(actual['s'], values['s'])
+
+    c = matlab.get('c')
+    for el,elel in zip(values['c'], c):
+        assert_equal(el,elel)
+
+    assert_equal(matlab.get_many([]), {})
+
+
+
+def test_get_many_missing(matlab):
+    matlab.put('a', 1.)
+
+    with pytest.raises(RuntimeError):
+        matlab.get_many(['a', 'MISSING_VARIABLE'])
+
+    ### The temporary struct is not left behind
+    matlab.eval("n = numel(who('GETMANY*'));")
+    assert_equal(matlab.get('n'), 0)
+
+
+
 def test_workspace_func(matlab):
 
     x = np.arange(10, dtype=float)
@@ -281,6 +391,58 @@ def test_workspace_pi(matlab):
     assert_equal(pi, np.pi)
 
 
+def test_workspace_func_error(matlab):
+
+    with pytest.raises(RuntimeError):
+        matlab.workspace.zeros('a', 'b', 'c')
+
+
+def test_workspace_nout_zero(matlab):
+
+    out = matlab.workspace.disp(1., nout=0)
+
+    assert_equal(out, ())
+
+
+def test_workspace_cache(matlab):
+
+    sin = matlab.workspace.sin
+    assert matlab.workspace.sin is sin
+
+    matlab.workspace.invalidate()
+    assert matlab.workspace.sin is not sin
+
+
+def test_workspace_cache_shadowing(matlab):
+
+    matlab.workspace.pi()
+
+    matlab.eval("pi = 3")
+    assert_equal(matlab.workspace.pi, 3)
+
+    matlab.eval("clear pi")
+    assert_equal(matlab.workspace.pi(), np.pi)
+
+
+def test_workspace_cache_internal_eval(matlab):
+
+    struct = matlab.workspace.struct
+
+    ### get_many() evaluates struct() internally
+    matlab.put('a', 1.)
+    matlab.get_many(['a'])
+    assert matlab.workspace.struct is struct
+
+
+def test_workspace_ret_cleared(matlab):
+
+    matlab.workspace.sin(np.zeros(1000))
+
+    ### Outputs of the last call are cleared by the next operation
+    matlab.eval("n = numel(who('RET*'));")
+    assert_equal(matlab.get('n'), 0)
+
+
 def test_workspace_set_get(matlab):
 
     matlab.workspace.a = 12.
@@ -526,6 +688,59 @@ def test_put_get_series(matlab):
     assert_equal(a, desired)
 
 
+def test_stats(matlab):
+    sin = matlab.workspace.sin
+    matlab.stats(reset=True)
+
+    events = []
+    matlab.add_stats_hook(events.append)
+
+    matlab.put('a', np.zeros(10))
+    matlab.get('a')
+    sin(np.zeros(3))
+
+    stats = matlab.stats()
+
+    assert_equal(stats['put']['count'], 1)
+    assert_equal(stats['put']['bytes'], 80)
+    assert_equal(stats['get']['count'], 1)
+    assert_equal(stats['get']['bytes'], 80)
+    assert_equal(stats['call']['count'], 1)
+    assert_equal(sum(stats['get']['histogram_us'].values()), 1)
+
+    assert_equal(events[0].op, 'put')
+    assert_equal(events[0].name, 'a')
+
+    matlab.remove_stats_hook(events.append)
+
+
+
+def test_tracer(matlab):
+    tracer = matlab_wrapper.Tracer()
+    matlab.tracer = tracer
+
+    c = np.array([1., 'a', np.eye(2)], dtype='O')
+
+    matlab.put('c', c)
+    matlab.get('c')
+    matlab.workspace.max(1., 2.)
+
+    matlab.tracer = matlab_wrapper.trace.null_tracer
+
+    names = [e['name'] for e in tracer.events()]
+
+    assert 'engPutVariable' in names
+    assert 'engGetVariable' in names
+    assert 'engEvalString' in names
+    assert 'max' in names
+    assert_equal(names.count('cell'), 6)
+
+    for e in tracer.events():
+        assert_equal(e['ph'], 'X')
+        assert e['dur'] >= 0
+
+
+
 def test_put_object(matlab):
 
     with pytest.raises(NotImplementedError):
@@ -539,3 +754,362 @@ def test_cell_dimension(matlab):
     matlab.eval(command)
     cellNumEqualDims = matlab.get('cellNumEqualDims')
     assert(cellNumEqualDims.shape == (3,))
+
+
+
+def test_session_pool():
+    pool = matlab_wrapper.MatlabSessionPool(2, options='-nojvm')
+
+    with pool.session() as matlab:
+        matlab.put('a', 2.)
+        assert_equal(matlab.get('a'), 2.)
+
+    x = np.arange(5, dtype=float)
+    ys = pool.map('sin', x)
+
+    assert_equal(ys, np.sin(x))
+
+    ys = pool.map('max', [(1., 2.), (4., 3.)])
+
+    assert_equal(ys, [2., 4.])
+
+    assert_equal(pool.health_check(), 0)
+
+    with pool.session() as matlab:
+        pool.close()
+
+        ### Checked out sessions are closed too
+        with pytest.raises(RuntimeError):
+            matlab.get('a')
+
+    with pytest.raises(RuntimeError):
+        with pool.session() as matlab:
+            pass
+
+    with pytest.raises(RuntimeError):
+        pool.map('sin', x)
+
+
+
+def test_prewarmer():
+    prewarmer = matlab_wrapper.EnginePrewarmer(
+        1,
+        init_script="PREWARMED = 1;",
+        options='-nojvm'
+    )
+
+    matlab = prewarmer.session()
+    assert_equal(matlab.get('PREWARMED'), 1)
+
+    matlab = prewarmer.session()
+    assert_equal(matlab.get('PREWARMED'), 1)
+
+    prewarmer.close()
+
+
+
+def test_prewarmer_retry(monkeypatch):
+    import time
+    from matlab_wrapper import prewarm
+
+    starts = []
+
+    def start_session(self):
+        starts.append(None)
+        if len(starts) < 3:
+            raise RuntimeError("Failed to start MATLAB")
+        return 'session'
+
+    monkeypatch.setattr(prewarm, 'retry_delay', 0.01)
+    monkeypatch.setattr(prewarm.EnginePrewarmer, '_start_session', start_session)
+
+    prewarmer = prewarm.EnginePrewarmer(1)
+
+    ### Failed starts are retried
+    time.sleep(0.5)
+    assert_equal(prewarmer.session(), 'session')
+    assert len(starts) >= 3
+
+    prewarmer.close()
+
+
+
+def test_threads(matlab):
+    import threading
+
+    errors = []
+
+    def worker(i):
+        try:
+            for j in range(20):
+                x = np.arange(10, dtype=float) + i + j
+                name = 'thread{}'.format(i)
+
+                matlab.put(name, x)
+                assert_equal(matlab.get(name), x)
+                assert_equal(matlab.workspace.plus(x, 1.), x + 1)
+
+                with pytest.raises(RuntimeError):
+                    matlab.eval("error('thread:test', 'Error {}')".format(i))
+
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert_equal(errors, [])
+
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires shared_memory")
+def test_process_farm():
+    x = np.asfortranarray(np.random.rand(100, 200))
+
+    with matlab_wrapper.MatlabProcessFarm(2, shared_threshold=1024, options='-nojvm') as farm:
+        ys = farm.map('sin', [x, 1.])
+        assert_equal(ys[0], np.sin(x))
+        assert_equal(ys[1], np.sin(1.))
+
+        y, i = farm.submit('sort', x, nout=2).result()
+        assert_equal(y, np.sort(x, axis=0))
+
+        ### Large arrays inside a tuple argument
+        a = np.random.rand(1000)
+        b = np.random.rand(1000)
+        y = farm.submit('sum', (a, b)).result()
+        assert_almost_equal(y, a + b)
+
+        with pytest.raises(RuntimeError):
+            farm.submit('onesBLA', 10).result()
+
+
+
+def test_server_framing():
+    import socket
+    from matlab_wrapper.server import send_message, recv_message, decode_value
+
+    a, b = socket.socketpair()
+
+    cell = np.empty(2, dtype='O')
+    cell[0] = np.arange(3.)
+    cell[1] = 'bla'
+
+    value = {
+        'x': np.asfortranarray(np.random.rand(3, 4)),
+        'cell': cell,
+        'tuple': (1, 2+3j, 'bla'),
+        'empty': np.zeros((0, 3)),
+    }
+
+    send_message(a, {'op': 'put'}, value)
+    header, buffers = recv_message(b)
+    out = decode_value(header['value'], buffers)
+
+    assert_equal(header['op'], 'put')
+    assert_equal(out['x'], value['x'])
+    assert out['x'].flags.f_contiguous
+    assert_equal(out['cell'][0], cell[0])
+    assert_equal(out['cell'][1], cell[1])
+    assert_equal(out['tuple'], value['tuple'])
+    assert_equal(out['empty'].shape, (0, 3))
+
+
+
+def test_server(tmpdir):
+    import threading
+
+    path = str(tmpdir.join('matlab.sock'))
+    server = matlab_wrapper.MatlabServer(path, size=1, options='-nojvm')
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    ### Only the owner can connect
+    assert_equal(os.stat(path).st_mode & 0o777, 0o600)
+
+    matlab = matlab_wrapper.MatlabClient(path)
+    start_dir = matlab.workspace.pwd()
+
+    matlab.put('a', np.arange(4.))
+    matlab.eval('b = a * 2')
+    assert_equal(matlab.get('b'), np.arange(4.) * 2)
+    assert_equal(matlab.workspace.b, np.arange(4.) * 2)
+    assert_equal(matlab.workspace.sin(0.), 0.)
+
+    y, i = matlab.workspace.sort(np.array([2.,1.,3.]), nout=2)
+    assert_equal(y, [1,2,3])
+
+    with pytest.raises(RuntimeError):
+        matlab.eval('a = onesBLA(10)')
+
+    matlab.eval("cd('..')")
+    matlab.close()
+
+    ### The next client gets a clean session
+    matlab = matlab_wrapper.MatlabClient(path)
+    assert_equal(matlab.workspace.pwd(), start_dir)
+    with pytest.raises(RuntimeError):
+        matlab.get('b')
+
+    matlab.close()
+    server.close()
+
+
+
+def test_shm_transport():
+    matlab = matlab_wrapper.MatlabSession(options='-nojvm', shm_threshold=1024)
+
+    arrays = [
+        np.asfortranarray(np.random.rand(30, 40, 2)),
+        np.random.rand(50, 60),
+        np.arange(1000, dtype='int16'),
+        np.random.rand(40, 40).astype('float32'),
+        np.random.rand(50, 50) > 0.5,
+        np.array([1., 2., 3.]),  # below threshold
+    ]
+
+    for x in arrays:
+        matlab.put('x', x)
+        assert_equal(matlab.get('x'), x)
+
+        ### Same result as the engine transport
+        matlab.eval('y = x;')
+        assert_equal(matlab.get('y').dtype, x.dtype)
+
+    ### 1-D arrays are rows for both transports
+    matlab.eval('s = size(x);')
+    assert_equal(matlab.get('s'), [1, 3])
+
+    matlab.put('x', np.arange(1000.))
+    matlab.eval('s = size(x);')
+    assert_equal(matlab.get('s'), [1, 1000])
+
+    stats = matlab.stats()
+    assert_equal(stats['put']['count'], len(arrays) + 1)
+
+    ### Transfer files are private
+    assert_equal(os.stat(matlab._shm_private).st_mode & 0o777, 0o700)
+    assert_equal(os.listdir(matlab._shm_private), [])
+
+
+
+def test_put_get_bulk(matlab):
+    pytest.importorskip('scipy')
+
+    cell = np.empty(2, dtype='O')
+    cell[0] = np.arange(3.)
+    cell[1] = 'bla'
+
+    values = {
+        'bulk_a': np.random.rand(20, 30),
+        'bulk_b': np.arange(5, dtype='int32'),
+        'bulk_c': cell,
+        'bulk_s': 'string',
+        'bulk_l': np.array([True, False]),
+    }
+
+    matlab.put_bulk(values)
+
+    for name,value in values.items():
+        assert_equal(matlab.get(name), value)
+
+    ### 1-D arrays are rows as with put()
+    matlab.eval('s = size(bulk_b);')
+    assert_equal(matlab.get('s'), [1, 5])
+
+    out = matlab.get_bulk(values.keys())
+
+    for name,value in values.items():
+        assert_equal(out[name], matlab.get(name))
+
+    ### Multi-row char arrays are joined column by column as in get()
+    matlab.eval("bulk_m = ['ab'; 'cd'];")
+    out = matlab.get_bulk(['bulk_m'])
+    assert_equal(out['bulk_m'], matlab.get('bulk_m'))
+    assert_equal(out['bulk_m'], 'acbd')
+
+    stats = matlab.stats()
+    assert stats['put_bulk']['count'] >= 1
+    assert stats['get_bulk']['count'] >= 1
+
+
+
+def test_timeout():
+    matlab = matlab_wrapper.MatlabSession(options='-nojvm')
+
+    matlab.eval('a = 1;', timeout=10)
+    assert_equal(matlab.workspace.plus(1., 2., timeout=10), 3.)
+
+    with pytest.raises(matlab_wrapper.TimeoutError):
+        matlab.eval('pause(60)', timeout=1)
+
+    with pytest.raises(RuntimeError):
+        matlab.get('a')
+
+    matlab.restart()
+
+    matlab.put('a', 2.)
+    assert_equal(matlab.get('a'), 2.)
+
+
+
+def test_supervised_session():
+    matlab = matlab_wrapper.SupervisedSession(
+        max_calls=3,
+        init_script="INIT = 1;",
+        options='-nojvm'
+    )
+
+    assert matlab.session.pid > 0
+
+    matlab.put('a', 2.)
+    assert_equal(matlab.get('a'), 2.)
+    assert_equal(matlab.workspace.sin(0.), 0.)
+    assert_equal(matlab.process_info()['calls'], 3)
+
+    ### Limit of calls reached
+    assert_equal(matlab.workspace.INIT, 1)
+    with pytest.raises(RuntimeError):
+        matlab.get('a')
+
+    stats = matlab.stats()
+    assert_equal(stats['restart']['count'], 1)
+    assert_equal(stats['put']['count'], 1)
+
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires asyncio")
+def test_async_session():
+    import asyncio
+
+    async def run():
+        matlab = matlab_wrapper.AsyncMatlabSession(options='-nojvm')
+
+        await matlab.put('a', 12.)
+        await matlab.eval('b = a * 2')
+        b = await matlab.get('b')
+        assert_equal(b, 24)
+
+        b = await matlab.workspace.b
+        assert_equal(b, 24)
+
+        with pytest.raises(AttributeError):
+            matlab.workspace.a = 5.
+
+        y, i = await matlab.workspace.sort(np.array([2,1,3]), nout=2)
+        assert_equal(y, [1,2,3])
+
+        with pytest.raises(RuntimeError):
+            await matlab.eval('a = onesBLA(10)')
+
+        await matlab.close()
+
+        with pytest.raises(RuntimeError):
+            await matlab.get('b')
+
+    asyncio.run(run())
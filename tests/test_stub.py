@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test conversions against stand-in MATLAB libraries (no MATLAB
+required).  The libraries are built with `make -C tests/stub_matlab`.
+
+"""
+
+from __future__ import division, absolute_import, print_function
+
+import subprocess
+from os.path import join, dirname, abspath, exists
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import matlab_wrapper
+
+import pytest
+
+
+STUB_DIR = join(dirname(abspath(__file__)), 'stub_matlab')
+
+NUMERIC_DTYPES = ('int8', 'int16', 'int32', 'int64', 'uint8',
+                  'uint16', 'uint32', 'uint64', 'single', 'double')
+
+
+@pytest.fixture(scope='module')
+def matlab():
+    try:
+        subprocess.check_call(['make', '-s', '-C', STUB_DIR])
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("Unable to build stub MATLAB libraries")
+
+    matlab = matlab_wrapper.MatlabSession(
+        matlab_root=join(STUB_DIR, 'root'),
+        buffer_size=1024
+    )
+    return matlab
+
+
+
+def test_put_get_numeric(matlab):
+    for dtype in NUMERIC_DTYPES:
+        a = np.random.randn(3,2,4) * 10
+        a = a.astype(dtype)
+
+        matlab.put('a', a)
+        aa = matlab.get('a')
+
+        assert_equal(a.dtype, aa.dtype)
+        assert_equal(a, aa)
+
+
+def test_put_get_complex(matlab):
+    for dtype in ("complex64", "complex128"):
+        a = np.random.randn(2,4,3) + np.random.randn(2,4,3)*1j
+        a = a.astype(dtype)
+
+        matlab.put('a', a)
+        aa = matlab.get('a')
+
+        assert_equal(a.dtype, aa.dtype)
+        assert_equal(a, aa)
+
+
+def test_put_get_nocopy(matlab):
+    a = np.random.randn(5,6)
+
+    matlab.put('a', a.T)
+    aa = matlab.get('a', copy=False)
+
+    assert_equal(a.T, aa)
+
+
+def test_get_nocopy_owner(matlab, monkeypatch):
+    import gc
+
+    owner_class = matlab_wrapper.matlab_session.MxArrayOwner
+    finalized = []
+    finalize = owner_class.__del__
+
+    def owner_del(self):
+        finalized.append(self._pm)
+        finalize(self)
+
+    monkeypatch.setattr(owner_class, '__del__', owner_del)
+
+    a = np.random.randn(5,6)
+    matlab.put('a', a)
+
+    aa = matlab.get('a', copy=False)
+    view = aa[1:3, 2:]
+
+    ### The slice keeps the mxArray alive
+    del aa
+    gc.collect()
+
+    assert_equal(finalized, [])
+    assert_equal(view, a[1:3, 2:])
+
+    del view
+    gc.collect()
+
+    assert_equal(len(finalized), 1)
+
+
+def test_put_get_cell(matlab):
+    a = np.array([1., 'text', np.eye(2,3)], dtype='O')
+
+    matlab.put('a', a)
+    aa = matlab.get('a')
+
+    for el,elel in zip(a, aa):
+        assert_equal(el, elel)
+
+
+def test_put_get_struct(matlab):
+    a = np.rec.fromrecords([
+        (1, 'a', 1.),
+        (2, 'bb', 2.),
+    ])
+
+    matlab.put('a', a)
+    aa = matlab.get('a')
+
+    assert_equal(a, aa)
+
+
+def test_put_get_many(matlab):
+    values = {'a': np.arange(3.), 'b': 'text'}
+
+    matlab.put_many(values)
+    actual = matlab.get_many(['a', 'b'])
+
+    assert_equal(actual, values)
+
+
+def test_clear(matlab):
+    matlab.put('a', 1.)
+    matlab.eval('clear a')
+
+    with pytest.raises(RuntimeError):
+        matlab.get('a')
+
+
+def test_call_argument_error(matlab, monkeypatch):
+    import weakref
+
+    destroyed = []
+    destroy = matlab._libmx.mxDestroyArray
+
+    def mx_destroy_array(pm):
+        destroyed.append(pm)
+        destroy(pm)
+
+    monkeypatch.setattr(matlab._libmx, 'mxDestroyArray', mx_destroy_array)
+
+    func = matlab_wrapper.matlab_session.MatlabFunction('disp', weakref.ref(matlab))
+
+    ### Arguments converted before the error are freed
+    with pytest.raises(NotImplementedError):
+        func(np.arange(3.), {'x': 1})
+
+    assert_equal(len(destroyed), 1)
+
+
+def test_put_many_error(matlab, monkeypatch):
+    destroyed = []
+    destroy = matlab._libmx.mxDestroyArray
+
+    def mx_destroy_array(pm):
+        destroyed.append(pm)
+        destroy(pm)
+
+    monkeypatch.setattr(matlab._libmx, 'mxDestroyArray', mx_destroy_array)
+
+    with pytest.raises(NotImplementedError):
+        matlab.put_many({'a': 1., 'b': {'x': 1}})
+
+    assert_equal(len(destroyed), 1)
+
+
+def test_del_closed_engine(matlab, monkeypatch, tmpdir):
+    session = matlab_wrapper.MatlabSession(
+        matlab_root=join(STUB_DIR, 'root'),
+        shm_dir=str(tmpdir)
+    )
+    private = dirname(session._shm_path())
+
+    def eng_close(ep):
+        raise RuntimeError("engClose failed")
+
+    ### engClose of a killed engine fails, __del__ must not raise
+    monkeypatch.setattr(session._libeng, 'engClose', eng_close)
+    session.__del__()
+
+    assert not exists(private)